@@ -3,3 +3,5 @@ from django.apps import AppConfig
 
 class CatalogoConfig(AppConfig):
     name = 'catalogo'
+    def ready(self):
+        import catalogo.signals # Invalida la caché del menú al editar la carta
@@ -0,0 +1,409 @@
+# catalogo/menu_cache.py
+"""
+Caché versionada del menú.
+
+Cada cambio en el catálogo (ver catalogo/signals.py) sube un número de versión
+guardado en el caché compartido. Todo lo que se construye a partir del menú se
+guarda bajo esa versión, en dos niveles:
+
+1. Un diccionario local del proceso (lectura sin red ni pickle).
+2. El caché de Django (settings.CACHES), compartido entre workers.
+
+La invalidación es exacta: al subir la versión, las claves viejas simplemente
+dejan de consultarse. El TTL solo sirve para liberar memoria.
+
+Lo que depende de la disponibilidad de una sede (carta, JSON, máscara de
+variantes) lleva además la versión de esa sede (obtener_sede): un
+InsumoCritico que se agota solo invalida lo de su sede.
+"""
+
+import json
+import time
+from django.core.cache import cache
+from django.db import models, transaction
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from .models import Categoria, Plato, Variante, GrupoOpciones, Opcion, Inclusion
+from .seleccion import ReglaGrupo, ValidadorSeleccion
+from core.dinero import a_centimos
+
+CLAVE_VERSION = 'catalogo:menu:version'
+CLAVE_ACTUALIZADO = 'catalogo:menu:actualizado'
+CLAVE_VERSION_SEDE = 'catalogo:sede:{}:version'
+TIEMPO_VIDA = 60 * 60 * 24  # Limpieza de versiones viejas, NO invalidación
+
+_local = {}
+_local_version = None
+_local_sedes = {}  # {sede_id: versión de la sede que hay en _local}
+
+
+# --- VERSIÓN DEL MENÚ ---
+
+def version_menu():
+    """Devuelve la versión vigente del menú (la crea si el caché está vacío)."""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Partimos de la hora actual para no reciclar versiones de un caché anterior
+        ahora = int(time.time())
+        if cache.add(CLAVE_VERSION, ahora, timeout=None):
+            cache.set(CLAVE_ACTUALIZADO, ahora, timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def actualizado_menu():
+    """Timestamp (segundos) del último cambio conocido del menú, para Last-Modified."""
+    actualizado = cache.get(CLAVE_ACTUALIZADO)
+    if actualizado is None:
+        # Sin registro del último cambio: asumimos "ahora" (fuerza respuesta completa)
+        actualizado = int(time.time())
+        cache.add(CLAVE_ACTUALIZADO, actualizado, timeout=None)
+    return actualizado
+
+
+def _avanzar_actualizado():
+    # Last-Modified tiene precisión de segundos: cada cambio avanza al menos 1s
+    # para que If-Modified-Since nunca confunda dos versiones seguidas
+    anterior = cache.get(CLAVE_ACTUALIZADO) or 0
+    cache.set(CLAVE_ACTUALIZADO, max(int(time.time()), anterior + 1), timeout=None)
+
+
+def _subir_version():
+    try:
+        cache.incr(CLAVE_VERSION)
+        _avanzar_actualizado()
+    except ValueError:
+        # La clave no existía (caché reiniciado): empezamos una serie nueva
+        version_menu()
+
+
+def invalidar_menu():
+    """
+    Sube la versión del menú cuando la transacción actual confirme.
+    Así nadie reconstruye el menú leyendo datos que aún no se guardaron.
+    """
+    transaction.on_commit(_subir_version)
+
+
+# --- ALMACÉN DE DOS NIVELES ---
+
+def obtener(clave, construir):
+    """
+    Devuelve el valor de 'clave' para la versión vigente del menú.
+    Si no existe en ningún nivel, lo construye con construir() y lo guarda.
+    """
+    global _local_version
+    version = version_menu()
+
+    if version != _local_version:
+        _local.clear()
+        _local_version = version
+
+    if clave in _local:
+        return _local[clave]
+
+    clave_compartida = f'catalogo:menu:{version}:{clave}'
+    valor = cache.get(clave_compartida)
+    if valor is None:
+        valor = construir()
+        cache.set(clave_compartida, valor, timeout=TIEMPO_VIDA)
+
+    _local[clave] = valor
+    return valor
+
+
+# --- VERSIÓN POR SEDE ---
+
+def version_sede(sede_id):
+    """Versión de la disponibilidad de una sede (sube con sus InsumoCritico)."""
+    clave = CLAVE_VERSION_SEDE.format(sede_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, int(time.time()), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def obtener_sede(sede_id, clave, construir):
+    """
+    Como obtener(), pero atado también a la versión de la sede.
+    Sin sede (no hay ninguna registrada) equivale a obtener().
+    """
+    if sede_id is None:
+        return obtener(clave, construir)
+
+    version = version_sede(sede_id)
+    anterior = _local_sedes.get(sede_id)
+    if anterior != version:
+        # Lo construido con la versión anterior de la sede ya no se consultará
+        sufijo = f':sede{sede_id}:{anterior}'
+        for vieja in [k for k in _local if k.endswith(sufijo)]:
+            del _local[vieja]
+        _local_sedes[sede_id] = version
+    return obtener(f'{clave}:sede{sede_id}:{version}', construir)
+
+
+def _recalcular_sede(sede_id):
+    try:
+        cache.incr(CLAVE_VERSION_SEDE.format(sede_id))
+    except ValueError:
+        version_sede(sede_id)
+    _avanzar_actualizado()
+    # La máscara nueva se arma aquí y no en la próxima visita a la carta
+    mascara_sede(sede_id)
+
+
+def invalidar_sede(sede_id):
+    """Recalcula la disponibilidad de UNA sede cuando la transacción actual confirme."""
+    transaction.on_commit(lambda: _recalcular_sede(sede_id))
+
+
+# --- SNAPSHOT DEL MENÚ ---
+
+def obtener_categorias_menu(marca):
+    """
+    Árbol Categoria -> platos -> variantes de una marca, con el conteo de
+    grupos de opciones de cada variante resuelto en las queries del prefetch
+    (3 queries sin importar el tamaño de la carta). La disponibilidad depende
+    de la sede y NO va aquí: sale de mascara_sede().
+    """
+    return Categoria.objects.filter(
+        marca=marca,
+        activo=True
+    ).prefetch_related(
+        'platos',
+        models.Prefetch('platos__variantes', queryset=Variante.objects.con_opciones()),
+    ).order_by('orden')
+
+
+def snapshot_menu(marca):
+    """
+    Categorías de la marca ya evaluadas (con sus prefetch) para la versión
+    vigente. Es de solo lectura: se comparte entre todas las peticiones.
+    """
+    return obtener(
+        f'snapshot:{marca.id}',
+        lambda: tuple(obtener_categorias_menu(marca)),
+    )
+
+
+def html_menu(marca, sede_id=None):
+    """
+    HTML de la carta (platos_list.html) para la versión vigente y la sede.
+    Se renderiza sin request: no depende del carrito, así que un solo render
+    sirve para todos los visitantes de la sede.
+    """
+    return obtener_sede(
+        sede_id,
+        f'html:{marca.id}',
+        lambda: render_to_string('catalogo/platos_list.html', {
+            'categorias': snapshot_menu(marca),
+            'disponibles': mascara_sede(sede_id),
+        }),
+    )
+
+
+def _serializar_menu(marca, sede_id):
+    """
+    Árbol categoría -> plato -> variante con lo que pinta la carta (menu.html
+    la arma en el navegador): ids, nombres, precios en céntimos, disponibilidad
+    en la sede y la URL de los modales. Nada de HTML.
+    """
+    mascara = mascara_sede(sede_id)
+    categorias = []
+    for categoria in snapshot_menu(marca):
+        platos = []
+        for plato in categoria.platos.all():
+            variantes = [
+                {
+                    'id': variante.id,
+                    'nombre': variante.nombre,
+                    'precio_centimos': a_centimos(variante.precio),
+                    'disponible': disponible_en(mascara, variante.id),
+                    'tiene_opciones': variante.tiene_opciones(),
+                    'url_modal': reverse('cargar_modal_opciones', args=[variante.id]),
+                }
+                for variante in plato.variantes.all()
+            ]
+            platos.append({
+                'id': plato.id,
+                'nombre': plato.nombre,
+                'descripcion': plato.descripcion,
+                'imagen': plato.imagen.url if plato.imagen else None,
+                'disponible': any(variante['disponible'] for variante in variantes),
+                'variantes': variantes,
+            })
+        if platos:
+            categorias.append({
+                'id': categoria.id,
+                'nombre': categoria.nombre,
+                'url_modales': reverse('modales_categoria', args=[categoria.id]),
+                'platos': platos,
+            })
+
+    return json.dumps({
+        'version': version_menu(),
+        'sede': sede_id,
+        'categorias': categorias,
+    }, separators=(',', ':'))
+
+
+def json_menu(marca, sede_id=None):
+    """
+    Carta de la marca ya serializada a JSON (texto) para la versión vigente y
+    la sede. No incluye nada del carrito, así que las versiones sirven como ETag.
+    """
+    return obtener_sede(sede_id, f'json:{marca.id}', lambda: _serializar_menu(marca, sede_id))
+
+
+def etag_menu(marca, sede_id=None):
+    if sede_id is None:
+        return f'"menu-{marca.id}-{version_menu()}"'
+    return f'"menu-{marca.id}-{version_menu()}-{sede_id}-{version_sede(sede_id)}"'
+
+
+# --- MODAL DE OPCIONES ---
+
+def _variantes_para_modal():
+    """Variantes con sus inclusiones y grupos activos (y opciones activas) precargados."""
+    return Variante.objects.prefetch_related(
+        models.Prefetch('inclusiones', queryset=Inclusion.objects.filter(activo=True)),
+        models.Prefetch(
+            'grupos_opciones',
+            queryset=GrupoOpciones.objects.filter(activo=True).prefetch_related(
+                models.Prefetch('opciones', queryset=Opcion.objects.filter(activo=True))
+            ),
+        ),
+    )
+
+
+def html_grupo(grupo):
+    """HTML de un grupo de opciones: uno solo por grupo, compartido entre variantes."""
+    return obtener(
+        f'grupo:{grupo.id}',
+        lambda: render_to_string('catalogo/grupo_opciones.html', {'grupo': grupo}),
+    )
+
+
+def _renderizar_modal(variante):
+    return render_to_string('catalogo/modal_opciones.html', {
+        'variante': variante,
+        'inclusiones': variante.inclusiones.all(),
+        'grupos_html': [html_grupo(grupo) for grupo in variante.grupos_opciones.all()],
+    })
+
+
+def html_modal(variante_id):
+    """HTML del modal de opciones de una variante para la versión vigente (404 si no existe)."""
+    return obtener(
+        f'modal:{variante_id}',
+        lambda: _renderizar_modal(get_object_or_404(_variantes_para_modal(), id=variante_id)),
+    )
+
+
+def _construir_modales_categoria(categoria_id):
+    # Todas las variantes activas: en la carta, "Agregar" también abre el modal
+    variantes = _variantes_para_modal().filter(plato__categoria_id=categoria_id, activo=True)
+    modales = {}
+    for variante in variantes:
+        html = obtener(f'modal:{variante.id}', lambda: _renderizar_modal(variante))
+        modales[reverse('cargar_modal_opciones', args=[variante.id])] = html
+    return modales
+
+
+def html_modales_categoria(categoria_id):
+    """
+    {url_del_modal: html} de todas las variantes activas de una categoría,
+    para que el front los tenga listos antes del click.
+    """
+    return obtener(
+        f'modales:{categoria_id}',
+        lambda: _construir_modales_categoria(categoria_id),
+    )
+
+
+# --- TABLA DE PRECIOS Y VALIDACIÓN ---
+
+def _construir_tabla_precios():
+    """
+    {variante_id: ficha} con todo lo necesario para validar y cobrar un
+    "agregar" sin tocar la BD:
+
+    - 'precio_centimos': precio base en céntimos (int)
+    - 'validador': ValidadorSeleccion compilado con sus grupos activos
+
+    La disponibilidad NO va en la ficha: depende de la sede (disponible_en).
+    Son 4 queries para toda la carta, una vez por versión del menú.
+    """
+    precios = {
+        variante_id: a_centimos(precio)
+        for variante_id, precio in Variante.objects.values_list('id', 'precio')
+    }
+
+    opciones_por_grupo = {}
+    for opcion_id, grupo_id, precio_extra in (
+        Opcion.objects.filter(activo=True, grupo__activo=True)
+        .values_list('id', 'grupo_id', 'precio_extra')
+    ):
+        opciones_por_grupo.setdefault(grupo_id, {})[opcion_id] = a_centimos(precio_extra)
+
+    # Una regla por grupo, compartida por todas las variantes que lo usan
+    reglas = {
+        grupo_id: ReglaGrupo(
+            grupo_id, nombre, obligatorio, seleccion_multiple, minimo, maximo,
+            opciones_por_grupo.get(grupo_id, {}),
+        )
+        for grupo_id, nombre, obligatorio, seleccion_multiple, minimo, maximo in (
+            GrupoOpciones.objects.filter(activo=True).order_by('id')
+            .values_list('id', 'nombre', 'obligatorio', 'seleccion_multiple', 'minimo', 'maximo')
+        )
+    }
+
+    reglas_por_variante = {}
+    relacion = Variante.grupos_opciones.through.objects.filter(grupoopciones__activo=True)
+    for variante_id, grupo_id in relacion.order_by('grupoopciones_id').values_list('variante_id', 'grupoopciones_id'):
+        reglas_por_variante.setdefault(variante_id, []).append(reglas[grupo_id])
+
+    return {
+        variante_id: {
+            'precio_centimos': precio,
+            'validador': ValidadorSeleccion(reglas_por_variante.get(variante_id, ())),
+        }
+        for variante_id, precio in precios.items()
+    }
+
+
+def tabla_precios():
+    """Tabla de precios/validación de todas las variantes para la versión vigente."""
+    return obtener('precios:centimos', _construir_tabla_precios)
+
+
+# --- DISPONIBILIDAD POR SEDE ---
+# Matriz sede × variante: cada sede tiene un int de Python usado como bitset,
+# con el bit N encendido si la variante de id N se puede pedir ahí. Revisar
+# un ítem es un desplazamiento y un AND (disponible_en), sin queries.
+#
+# Un InsumoCritico pertenece a UNA sede: si en una sede se acaba el pescado,
+# los platos con pescado se apagan solo en esa sede.
+
+def _construir_mascara(sede_id):
+    # Una query: las variantes que el resolver en lote da por disponibles en la sede
+    mascara = 0
+    for variante_id in Variante.objects.disponibles(sede_id).values_list('id', flat=True):
+        mascara |= 1 << variante_id
+    return mascara
+
+
+def mascara_sede(sede_id):
+    """
+    Bitset de las variantes que se pueden pedir en la sede. Se recalcula
+    solo cuando cambia la carta o un InsumoCritico de ESA sede.
+    Sin sede solo cuentan los interruptores de variante y plato.
+    """
+    return obtener_sede(sede_id, 'mascara', lambda: _construir_mascara(sede_id))
+
+
+def disponible_en(mascara, variante_id):
+    """True si el bit de la variante está encendido en la máscara de una sede."""
+    return bool(mascara >> variante_id & 1)
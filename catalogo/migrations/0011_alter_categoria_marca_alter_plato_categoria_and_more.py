@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0010_inclusion_variante_inclusiones'),
+        ('core', '0002_rename_color_primario_marca_color_coorporativo_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoria',
+            name='marca',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='categorias', to='core.marca'),
+        ),
+        migrations.AlterField(
+            model_name='plato',
+            name='categoria',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='platos', to='catalogo.categoria'),
+        ),
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(fields=['marca', 'activo', 'orden'], name='categoria_marca_activo_orden'),
+        ),
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['marca', 'orden'], name='categoria_activas_orden'),
+        ),
+        migrations.AddIndex(
+            model_name='plato',
+            index=models.Index(fields=['categoria', 'orden', 'nombre'], name='plato_categoria_orden'),
+        ),
+        migrations.AddIndex(
+            model_name='variante',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['plato'], name='variante_activas_plato'),
+        ),
+    ]
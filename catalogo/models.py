@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Q
 from core.models import Marca, Sede
 # Create your models here.
 
@@ -12,9 +13,17 @@ class InsumoCritico(models.Model):
         estado = "✅" if self.disponible else "❌ AGOTADO"
         return f"{self.nombre} ({self.sede.nombre}) - {estado}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Sede con la que se leyó: si cambia, las dos sedes recalculan su disponibilidad
+        instancia._sede_original = instancia.__dict__.get('sede_id')
+        return instancia
+
 # Categorias (Entradas, Bebidas, Fondos, etc)
 class Categoria(models.Model):
-    marca = models.ForeignKey(Marca, on_delete=models.CASCADE, related_name='categorias')
+    # Sin índice propio: lo cubren los índices de Meta, que empiezan por marca
+    marca = models.ForeignKey(Marca, on_delete=models.CASCADE, related_name='categorias', db_index=False)
     nombre = models.CharField(max_length=50)
     nombre_singular = models.CharField(
         max_length=50, 
@@ -27,13 +36,68 @@ class Categoria(models.Model):
     activo = models.BooleanField(default=True)
     class Meta:
         ordering = ['orden']
+        indexes = [
+            # Menú de una marca: filter(marca, activo=True).order_by('orden')
+            models.Index(fields=['marca', 'activo', 'orden'], name='categoria_marca_activo_orden'),
+            models.Index(
+                fields=['marca', 'orden'], name='categoria_activas_orden',
+                condition=models.Q(activo=True),
+            ),
+        ]
     def __str__(self):
         return f"{self.marca.nombre} - {self.nombre}"
     
+# --- DISPONIBILIDAD EN LOTE ---
+# En lugar de preguntar plato por plato (1 query cada vez), anotamos el queryset
+# completo con un EXISTS sobre los insumos agotados. Las propiedades
+# 'esta_disponible' leen esa anotación si está presente.
+#
+# Un InsumoCritico pertenece a UNA sede: con sede_id solo cuentan los insumos
+# agotados de esa sede; sin ella, los de cualquiera.
+
+def _insumos_agotados(plato_ref, sede_id=None):
+    agotados = InsumoCritico.objects.filter(plato=OuterRef(plato_ref), disponible=False)
+    if sede_id is not None:
+        agotados = agotados.filter(sede_id=sede_id)
+    return agotados
+
+
+class PlatoQuerySet(models.QuerySet):
+    def con_disponibilidad(self, sede_id=None):
+        """Anota 'insumo_agotado' para resolver esta_disponible sin queries extra."""
+        return self.annotate(insumo_agotado=Exists(_insumos_agotados('pk', sede_id)))
+
+
+class VarianteQuerySet(models.QuerySet):
+    def con_disponibilidad(self, sede_id=None):
+        """Anota 'insumo_agotado' (del plato padre) para cada variante."""
+        return self.annotate(insumo_agotado=Exists(_insumos_agotados('plato_id', sede_id)))
+
+    def con_opciones(self):
+        """
+        Anota 'total_grupos' (grupos de opciones activos) en una sola query agregada,
+        para que tiene_opciones() no consulte la BD por cada variante.
+        """
+        return self.annotate(
+            total_grupos=Count('grupos_opciones', filter=Q(grupos_opciones__activo=True))
+        )
+
+    def disponibles(self, sede_id=None):
+        """
+        Variantes que se pueden pedir, en una sola query: variante y plato
+        encendidos y, si se indica la sede, sin insumos agotados en ella.
+        """
+        variantes = self.filter(activo=True, plato__activo_manual=True)
+        if sede_id is None:
+            return variantes
+        return variantes.con_disponibilidad(sede_id).filter(insumo_agotado=False)
+
+
 # Platos
 class Plato(models.Model):
     marca = models.ForeignKey(Marca, on_delete=models.CASCADE, related_name='platos')
-    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='platos')
+    # Sin índice propio: plato_categoria_orden (Meta) empieza por categoria y además da el orden
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='platos', db_index=False)
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, help_text="Descripción para la web")
     imagen = models.ImageField(upload_to='platos/', blank=True, null=True)
@@ -41,10 +105,16 @@ class Plato(models.Model):
     # Si se acaba el 'Insumo Crítico', el plato se apaga solo
     insumos_clave = models.ManyToManyField(InsumoCritico, blank=True)
     orden = models.IntegerField(default=0, help_text="1 sale primero, 2 después...")
+
+    objects = PlatoQuerySet.as_manager()
     # --- CONFIGURACIÓN DE ORDENAMIENTO ---
     class Meta:
         # Ordena primero por 'orden' (ascendente) y luego por 'nombre' (si tienen el mismo número)
         ordering = ['orden', 'nombre']
+        indexes = [
+            # Prefetch del menú: platos de N categorías ya en su orden, sin sort aparte
+            models.Index(fields=['categoria', 'orden', 'nombre'], name='plato_categoria_orden'),
+        ]
     def __str__(self):
         # 1. Intentamos usar el singular (si el admin lo escribió)
         if self.categoria.nombre_singular:
@@ -68,8 +138,12 @@ class Plato(models.Model):
             return False
             
         # 2. Revisar insumos automáticos
-        # Buscamos si existe algun insumo vinculado que tenga disponible=False
-        hay_insumos_agotados = self.insumos_clave.filter(disponible=False).exists()
+        # Si el queryset vino con .con_disponibilidad() usamos la anotación (0 queries)
+        if hasattr(self, 'insumo_agotado'):
+            hay_insumos_agotados = self.insumo_agotado
+        else:
+            # Buscamos si existe algun insumo vinculado que tenga disponible=False
+            hay_insumos_agotados = self.insumos_clave.filter(disponible=False).exists()
         
         if hay_insumos_agotados:
             return False # Bloqueamos el paso
@@ -169,14 +243,30 @@ class Variante(models.Model):
     )
 
     activo = models.BooleanField(default=True, verbose_name="¿Disponible?", help_text="Desmarcar si se agotó solo esta presentación")
-    
+
+    objects = VarianteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Modales y tabla de precios solo leen variantes activas
+            models.Index(fields=['plato'], name='variante_activas_plato', condition=models.Q(activo=True)),
+        ]
+
     def __str__(self):
         return f"{self.plato.nombre} - {self.nombre} (S/ {self.precio})"
 
     @property
     def esta_disponible(self):
-        return self.activo and self.plato.esta_disponible
+        if not self.activo:
+            return False
+        # Anotada con .con_disponibilidad(): resolvemos sin tocar la BD
+        if hasattr(self, 'insumo_agotado'):
+            return self.plato.activo_manual and not self.insumo_agotado
+        return self.plato.esta_disponible
     # En catalogo/models.py, dentro de class Variante(...):
 
     def tiene_opciones(self):
+        # Anotada con .con_opciones(): usamos el conteo ya calculado
+        if hasattr(self, 'total_grupos'):
+            return self.total_grupos > 0
         return self.grupos_opciones.filter(activo=True).exists()
\ No newline at end of file
@@ -0,0 +1,105 @@
+# catalogo/seleccion.py
+"""
+Validación de las opciones elegidas en el modal, sin tocar la BD.
+
+Cada variante tiene un ValidadorSeleccion "compilado" a partir de sus grupos
+de opciones activos (ver menu_cache.tabla_precios). Se construye una vez por
+versión del menú y valida en una sola pasada:
+
+- Pertenencia: cada opción llega bajo SU grupo (campo grupo_<id>) y el grupo
+  es de la variante.
+- Cardinalidad: un grupo sin selección múltiple admite una sola opción; uno
+  múltiple respeta minimo/maximo (maximo 0 = sin límite).
+- Obligatorios: los grupos obligatorios deben tener al menos una opción.
+"""
+
+
+class SeleccionInvalida(Exception):
+    """Opciones enviadas que no se pueden aceptar (mensaje listo para el cliente)."""
+
+
+class ReglaGrupo:
+    """Restricciones de un grupo ya resueltas (se comparte entre variantes)."""
+
+    __slots__ = ('id', 'nombre', 'obligatorio', 'minimo', 'maximo', 'opciones')
+
+    def __init__(self, id, nombre, obligatorio, seleccion_multiple, minimo, maximo, opciones):
+        self.id = id
+        self.nombre = nombre
+        self.obligatorio = obligatorio
+        if seleccion_multiple:
+            self.minimo = max(minimo, 1 if obligatorio else 0)
+            self.maximo = maximo or None  # 0 = sin límite
+        else:
+            self.minimo = 1 if obligatorio else 0
+            self.maximo = 1
+        self.opciones = opciones  # {opcion_id: precio_extra en céntimos}
+
+
+class ValidadorSeleccion:
+    """Valida y cobra la selección de opciones de UNA variante."""
+
+    __slots__ = ('reglas',)
+
+    def __init__(self, reglas=()):
+        # {'grupo_<id>': ReglaGrupo}: la clave es el nombre del campo del formulario
+        self.reglas = {f'grupo_{regla.id}': regla for regla in reglas}
+
+    def validar(self, datos):
+        """
+        Recibe request.POST (o un MultiValueDict equivalente).
+        Devuelve (opciones_ids, extra en céntimos) o lanza SeleccionInvalida.
+        """
+        opciones_ids = []
+        extra = 0
+        vistos = set()
+
+        for campo in datos:
+            if not campo.startswith('grupo_'):
+                continue
+            regla = self.reglas.get(campo)
+            valores = [valor for valor in datos.getlist(campo) if valor != '']
+            if regla is None:
+                if valores:
+                    raise SeleccionInvalida('Selección de opciones no válida.')
+                continue
+
+            for valor in valores:
+                try:
+                    opcion_id = int(valor)
+                except ValueError:
+                    # isdigit() acepta '²' y otros dígitos que int() rechaza
+                    raise SeleccionInvalida('Selección de opciones no válida.')
+                if opcion_id not in regla.opciones or opcion_id in vistos:
+                    raise SeleccionInvalida('Selección de opciones no válida.')
+                vistos.add(opcion_id)
+                opciones_ids.append(opcion_id)
+                extra += regla.opciones[opcion_id]
+
+        # Cardinalidad y obligatorios: una pasada por los grupos de la variante
+        for campo, regla in self.reglas.items():
+            elegidas = sum(1 for valor in datos.getlist(campo) if valor != '')
+            if elegidas < regla.minimo:
+                if regla.obligatorio and elegidas == 0:
+                    raise SeleccionInvalida(f'Debes seleccionar: {regla.nombre}')
+                if elegidas:
+                    raise SeleccionInvalida(f'Elige al menos {regla.minimo} en {regla.nombre}')
+            if regla.maximo is not None and elegidas > regla.maximo:
+                raise SeleccionInvalida(f'Elige como máximo {regla.maximo} en {regla.nombre}')
+
+        return opciones_ids, extra
+
+    def extra_de(self, opciones_ids):
+        """
+        Recargo (céntimos) de opciones ya guardadas en el carrito, con los precios
+        vigentes. Lanza SeleccionInvalida si alguna dejó de estar disponible.
+        """
+        extra = 0
+        for opcion_id in opciones_ids:
+            for regla in self.reglas.values():
+                if opcion_id in regla.opciones:
+                    extra += regla.opciones[opcion_id]
+                    break
+            else:
+                raise SeleccionInvalida('Una de las opciones elegidas ya no está disponible.')
+        return extra
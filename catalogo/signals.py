@@ -0,0 +1,42 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from .models import (
+    InsumoCritico, Categoria, Plato, Variante, GrupoOpciones, Opcion, Inclusion
+)
+from .menu_cache import invalidar_menu, invalidar_sede
+
+# Cualquier cambio en estos modelos cambia lo que ve el cliente en la carta
+# (InsumoCritico no: solo cambia la disponibilidad de su sede, ver más abajo)
+MODELOS_MENU = (Categoria, Plato, Variante, GrupoOpciones, Opcion, Inclusion)
+
+# Relaciones M2M (se editan con filter_horizontal en el admin)
+RELACIONES_MENU = (
+    Plato.insumos_clave.through,
+    Variante.grupos_opciones.through,
+    Variante.inclusiones.through,
+)
+
+
+def invalidar_menu_por_cambio(sender, **kwargs):
+    # m2m_changed avisa antes y después; basta con el aviso final
+    if kwargs.get('action', '').startswith('pre_'):
+        return
+    invalidar_menu()
+
+
+for modelo in MODELOS_MENU:
+    post_save.connect(invalidar_menu_por_cambio, sender=modelo)
+    post_delete.connect(invalidar_menu_por_cambio, sender=modelo)
+
+for relacion in RELACIONES_MENU:
+    m2m_changed.connect(invalidar_menu_por_cambio, sender=relacion)
+
+
+def invalidar_sede_por_insumo(sender, instance, **kwargs):
+    # Agotar o reponer un insumo solo recalcula la máscara de su sede
+    for sede_id in {instance.sede_id, getattr(instance, '_sede_original', None)} - {None}:
+        invalidar_sede(sede_id)
+
+
+post_save.connect(invalidar_sede_por_insumo, sender=InsumoCritico)
+# Borrarlo se lleva sus filas de Plato.insumos_clave: también basta con su sede
+post_delete.connect(invalidar_sede_por_insumo, sender=InsumoCritico)
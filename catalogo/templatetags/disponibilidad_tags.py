@@ -0,0 +1,16 @@
+from django import template
+from catalogo.menu_cache import disponible_en
+
+register = template.Library()
+
+
+@register.filter(name='disponible_en')
+def variante_disponible_en(variante, mascara):
+    # 'mascara' es el bitset de la sede (menu_cache.mascara_sede)
+    return disponible_en(mascara, variante.id)
+
+
+@register.filter(name='plato_disponible_en')
+def plato_disponible_en(plato, mascara):
+    # Un plato está agotado en la sede si no le queda ninguna variante que pedir
+    return any(disponible_en(mascara, variante.id) for variante in plato.variantes.all())
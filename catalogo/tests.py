@@ -1,3 +1,347 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django.utils.datastructures import MultiValueDict
+
+from core.models import Marca, Sede
+from .menu_cache import disponible_en, html_menu, mascara_sede, snapshot_menu, tabla_precios
+from .models import Categoria, GrupoOpciones, InsumoCritico, Opcion, Plato, Variante
+from .seleccion import ReglaGrupo, SeleccionInvalida, ValidadorSeleccion
+
+# La de solo lectura es un espejo de 'default' en los tests (ver pedidos/tests.py)
+BASES = set(settings.DATABASES) - {'catalogo_lectura'}
+
+
+# --- SNAPSHOT DEL MENÚ ---
+
+class SnapshotMenuTests(TestCase):
+    databases = BASES
+
+
+    def setUp(self):
+        # La versión del menú sube al confirmar (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+            self.categoria = Categoria.objects.create(marca=self.marca, nombre='Fondos', orden=1)
+            self.plato = Plato.objects.create(marca=self.marca, categoria=self.categoria, nombre='Ceviche')
+            Variante.objects.create(plato=self.plato, nombre='Personal', precio=Decimal('30'))
+
+    def nombres(self):
+        return [
+            (plato.nombre, [v.nombre for v in plato.variantes.all()])
+            for categoria in snapshot_menu(self.marca)
+            for plato in categoria.platos.all()
+        ]
+
+    def test_se_arma_una_vez_por_version(self):
+        self.assertEqual(self.nombres(), [('Ceviche', ['Personal'])])
+        with self.assertNumQueries(0):
+            self.nombres()
+
+    def test_editar_la_carta_lo_invalida_al_confirmar(self):
+        self.nombres()
+        with self.captureOnCommitCallbacks(execute=True):
+            Variante.objects.create(plato=self.plato, nombre='Fuente', precio=Decimal('55'))
+            # Antes de confirmar se sigue sirviendo la versión anterior
+            self.assertEqual(self.nombres(), [('Ceviche', ['Personal'])])
+        self.assertEqual(self.nombres(), [('Ceviche', ['Personal', 'Fuente'])])
+
+    def test_categoria_apagada_sale_del_menu(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.activo = False
+            self.categoria.save()
+        self.assertEqual(self.nombres(), [])
+
+
+# --- HTML DE LA CARTA ---
+
+class HtmlMenuTests(TestCase):
+    databases = BASES
+
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+            categoria = Categoria.objects.create(marca=self.marca, nombre='Fondos', orden=1)
+            plato = Plato.objects.create(marca=self.marca, categoria=categoria, nombre='Ceviche')
+            self.variante = Variante.objects.create(plato=plato, nombre='Personal', precio=Decimal('30'))
+
+    def test_se_renderiza_una_vez_por_version(self):
+        html = html_menu(self.marca)
+        self.assertIn('Ceviche', html)
+        with self.assertNumQueries(0), mock.patch('catalogo.menu_cache.render_to_string') as render:
+            self.assertEqual(html_menu(self.marca), html)
+        render.assert_not_called()
+
+    def test_no_depende_del_visitante(self):
+        # Ni token CSRF ni cantidades del carrito: los completa menu.html
+        html = html_menu(self.marca)
+        self.assertNotIn('csrfmiddlewaretoken', html)
+        self.assertIn(f'id="badge-{self.variante.id}" class="badge bg-dark me-2 rounded-pill d-none">0<', html)
+
+    def test_la_vista_sirve_el_fragmento_cacheado(self):
+        respuesta = self.client.get('/terramar/')
+        self.assertContains(respuesta, 'Ceviche')
+        self.assertContains(respuesta, html_menu(self.marca), html=False)
+
+
+# --- API DE LA CARTA (JSON CONDICIONAL) ---
+
+class ApiMenuTests(TestCase):
+    databases = BASES
+
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+            categoria = Categoria.objects.create(marca=marca, nombre='Fondos', orden=1)
+            self.plato = Plato.objects.create(marca=marca, categoria=categoria, nombre='Ceviche')
+            self.variante = Variante.objects.create(plato=self.plato, nombre='Personal', precio=Decimal('30.50'))
+
+    def test_responde_la_carta_con_etag(self):
+        respuesta = self.client.get('/api/menu/terramar/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Cache-Control'], 'no-cache')
+        datos = respuesta.json()
+        self.assertEqual(datos['categorias'][0]['platos'][0]['nombre'], 'Ceviche')
+        self.assertIn('menu-', respuesta['ETag'])
+
+    def test_solo_datos_de_la_carta(self):
+        datos = self.client.get('/api/menu/terramar/').json()
+        self.assertNotIn('html', datos)
+        plato = datos['categorias'][0]['platos'][0]
+        self.assertTrue(plato['disponible'])
+        self.assertEqual(plato['variantes'], [{
+            'id': self.variante.id,
+            'nombre': 'Personal',
+            'precio_centimos': 3050,
+            'disponible': True,
+            'tiene_opciones': False,
+            'url_modal': f'/modal-opciones/{self.variante.id}/',
+        }])
+
+    def test_misma_version_responde_304(self):
+        etag = self.client.get('/api/menu/terramar/')['ETag']
+        respuesta = self.client.get('/api/menu/terramar/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+
+    def test_cambio_en_la_carta_cambia_la_etag(self):
+        primera = self.client.get('/api/menu/terramar/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plato.nombre = 'Ceviche clásico'
+            self.plato.save()
+        respuesta = self.client.get('/api/menu/terramar/', HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], primera['ETag'])
+        self.assertEqual(respuesta.json()['categorias'][0]['platos'][0]['nombre'], 'Ceviche clásico')
+
+
+# --- TABLA DE PRECIOS ---
+
+class TablaPreciosTests(TestCase):
+    databases = BASES
+
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+            categoria = Categoria.objects.create(marca=marca, nombre='Fondos', orden=1)
+            plato = Plato.objects.create(marca=marca, categoria=categoria, nombre='Lomo')
+            self.variante = Variante.objects.create(plato=plato, nombre='Personal', precio=Decimal('40'))
+            self.guarnicion = GrupoOpciones.objects.create(nombre='Guarnición', obligatorio=True)
+            self.papas = Opcion.objects.create(grupo=self.guarnicion, nombre='Papas')
+            self.arroz = Opcion.objects.create(grupo=self.guarnicion, nombre='Arroz', precio_extra=Decimal('2.50'))
+            Opcion.objects.create(grupo=self.guarnicion, nombre='Yuca', activo=False)
+            self.variante.grupos_opciones.add(self.guarnicion)
+
+    def test_ficha_de_la_variante(self):
+        ficha = tabla_precios()[self.variante.id]
+        self.assertEqual(ficha['precio_centimos'], 4000)
+        regla = ficha['validador'].reglas[f'grupo_{self.guarnicion.id}']
+        self.assertEqual(regla.opciones, {self.papas.id: 0, self.arroz.id: 250})
+        self.assertTrue(regla.obligatorio)
+
+    def test_tabla_sin_queries_mientras_no_cambie(self):
+        tabla_precios()
+        with self.assertNumQueries(0):
+            tabla_precios()
+
+    def test_agregar_cobra_y_valida_con_la_tabla(self):
+        def agregar(valor):
+            return self.client.post(
+                f'/agregar/{self.variante.id}/', {f'grupo_{self.guarnicion.id}': valor},
+                headers={'x-requested-with': 'XMLHttpRequest'},
+            )
+
+        self.assertEqual(agregar(self.arroz.id).json()['total_global'], 42.5)
+        yuca = Opcion.objects.get(nombre='Yuca')
+        for valor in (yuca.id, '²'):
+            with self.subTest(valor=valor):
+                respuesta = agregar(valor)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['message'], 'Selección de opciones no válida.')
+
+
+# --- SELECCIÓN DE OPCIONES ---
+
+class ValidadorSeleccionTests(SimpleTestCase):
+
+    def setUp(self):
+        # Guarnición: obligatoria y de una sola opción. Salsas: opcional, de 2 a 3
+        self.validador = ValidadorSeleccion([
+            ReglaGrupo(1, 'Guarnición', True, False, 0, 0, {10: 0, 11: 250}),
+            ReglaGrupo(2, 'Salsas', False, True, 2, 3, {20: 100, 21: 100, 22: 150, 23: 50}),
+        ])
+
+    def validar(self, **campos):
+        return self.validador.validar(MultiValueDict(campos))
+
+    def assertInvalida(self, mensaje, **campos):
+        with self.assertRaisesMessage(SeleccionInvalida, mensaje):
+            self.validar(**campos)
+
+    def test_devuelve_opciones_y_recargo_en_centimos(self):
+        opciones, extra = self.validar(grupo_1=['11'], grupo_2=['20', '22'])
+        self.assertEqual(opciones, [11, 20, 22])
+        self.assertEqual(extra, 500)
+
+    def test_grupo_opcional_puede_quedar_vacio(self):
+        self.assertEqual(self.validar(grupo_1=['10'], grupo_2=['']), ([10], 0))
+
+    def test_falta_obligatorio(self):
+        self.assertInvalida('Debes seleccionar: Guarnición', grupo_2=['20', '21'])
+
+    def test_grupo_de_una_opcion_no_admite_dos(self):
+        self.assertInvalida('Elige como máximo 1 en Guarnición', grupo_1=['10', '11'])
+
+    def test_respeta_minimo_y_maximo(self):
+        self.assertInvalida('Elige al menos 2 en Salsas', grupo_1=['10'], grupo_2=['20'])
+        self.assertInvalida(
+            'Elige como máximo 3 en Salsas', grupo_1=['10'], grupo_2=['20', '21', '22', '23']
+        )
+
+    def test_opcion_fuera_de_su_grupo(self):
+        self.assertInvalida('Selección de opciones no válida.', grupo_1=['20'])
+
+    def test_grupo_ajeno_a_la_variante(self):
+        self.assertInvalida('Selección de opciones no válida.', grupo_1=['10'], grupo_9=['10'])
+
+    def test_opcion_repetida(self):
+        self.assertInvalida('Selección de opciones no válida.', grupo_1=['10'], grupo_2=['20', '20'])
+
+    def test_valores_no_numericos(self):
+        for valor in ('abc', '²', '1.5'):
+            with self.subTest(valor=valor):
+                self.assertInvalida('Selección de opciones no válida.', grupo_1=[valor])
+
+    def test_extra_de_opciones_guardadas(self):
+        self.assertEqual(self.validador.extra_de([11, 23]), 300)
+        with self.assertRaises(SeleccionInvalida):
+            self.validador.extra_de([11, 99])
+
+
+# --- DISPONIBILIDAD POR SEDE ---
+
+class MascaraSedeTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        # La versión del menú y la de cada sede suben al confirmar (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+            categoria = Categoria.objects.create(marca=marca, nombre='Fondos', orden=1)
+            self.ceviche = Plato.objects.create(marca=marca, categoria=categoria, nombre='Ceviche')
+            lomo = Plato.objects.create(marca=marca, categoria=categoria, nombre='Lomo')
+            self.personal = Variante.objects.create(plato=self.ceviche, nombre='Personal', precio=Decimal('30'))
+            self.fuente = Variante.objects.create(plato=self.ceviche, nombre='Fuente', precio=Decimal('55'))
+            self.lomo = Variante.objects.create(plato=lomo, nombre='Personal', precio=Decimal('40'))
+            self.miraflores = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+            self.surco = Sede.objects.create(nombre='Surco', direccion='-', telefono='-')
+            self.pescado = InsumoCritico.objects.create(sede=self.miraflores, nombre='Pescado')
+            self.ceviche.insumos_clave.add(self.pescado)
+
+    def disponibles(self, sede):
+        mascara = mascara_sede(sede.id if sede else None)
+        return {
+            variante.id for variante in (self.personal, self.fuente, self.lomo)
+            if disponible_en(mascara, variante.id)
+        }
+
+    def test_todo_disponible(self):
+        todas = {self.personal.id, self.fuente.id, self.lomo.id}
+        self.assertEqual(self.disponibles(self.miraflores), todas)
+        self.assertEqual(self.disponibles(self.surco), todas)
+
+    def test_insumo_agotado_apaga_sus_platos_solo_en_su_sede(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pescado.disponible = False
+            self.pescado.save()
+        self.assertEqual(self.disponibles(self.miraflores), {self.lomo.id})
+        self.assertEqual(self.disponibles(self.surco), {self.personal.id, self.fuente.id, self.lomo.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pescado.disponible = True
+            self.pescado.save()
+        self.assertIn(self.personal.id, self.disponibles(self.miraflores))
+
+    def test_variante_apagada_no_esta_en_ninguna_sede(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fuente.activo = False
+            self.fuente.save()
+        for sede in (self.miraflores, self.surco, None):
+            with self.subTest(sede=sede):
+                self.assertEqual(self.disponibles(sede), {self.personal.id, self.lomo.id})
+
+    def test_borrar_un_insumo_agotado_lo_repone_en_su_sede(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pescado.disponible = False
+            self.pescado.save()
+        self.assertEqual(self.disponibles(self.miraflores), {self.lomo.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pescado.delete()
+        self.assertIn(self.personal.id, self.disponibles(self.miraflores))
+
+    def test_mascara_sin_queries_mientras_no_cambie(self):
+        mascara_sede(self.miraflores.id)
+        with self.assertNumQueries(0):
+            mascara_sede(self.miraflores.id)
+
+
+# --- DISPONIBILIDAD EN LOTE ---
+
+class DisponibilidadEnLoteTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+        categoria = Categoria.objects.create(marca=marca, nombre='Fondos', orden=1)
+        ceviche = Plato.objects.create(marca=marca, categoria=categoria, nombre='Ceviche')
+        lomo = Plato.objects.create(marca=marca, categoria=categoria, nombre='Lomo')
+        self.personal = Variante.objects.create(plato=ceviche, nombre='Personal', precio=Decimal('30'))
+        self.lomo = Variante.objects.create(plato=lomo, nombre='Personal', precio=Decimal('40'))
+        self.apagada = Variante.objects.create(plato=lomo, nombre='Fuente', precio=Decimal('70'), activo=False)
+        self.miraflores = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.surco = Sede.objects.create(nombre='Surco', direccion='-', telefono='-')
+        pescado = InsumoCritico.objects.create(sede=self.miraflores, nombre='Pescado', disponible=False)
+        ceviche.insumos_clave.add(pescado)
+
+    def ids(self, sede):
+        return set(Variante.objects.disponibles(sede.id if sede else None).values_list('id', flat=True))
+
+    def test_disponibles_por_sede(self):
+        self.assertEqual(self.ids(self.miraflores), {self.lomo.id})
+        self.assertEqual(self.ids(self.surco), {self.personal.id, self.lomo.id})
+        # Sin sede solo cuentan los interruptores de variante y plato
+        self.assertEqual(self.ids(None), {self.personal.id, self.lomo.id})
+
+    def test_una_query_para_todo_el_lote(self):
+        with self.assertNumQueries(1):
+            variantes = list(
+                Variante.objects.select_related('plato').con_disponibilidad(self.miraflores.id)
+            )
+        with self.assertNumQueries(0):
+            estados = {v.id: v.esta_disponible for v in variantes}
+        self.assertEqual(estados, {self.personal.id: False, self.lomo.id: True, self.apagada.id: False})
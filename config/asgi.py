@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+La pantalla de cocina (/cocina/<sede>/stream/) es una conexión SSE abierta por
+pantalla: sírvela con este application (p. ej. `uvicorn config.asgi:application`)
+y no con WSGI. Cada proceso tiene un solo bucle que consulta los pedidos y lo
+reparte a todas sus pantallas (pedidos/cocina.py).
 """
 
 import os
@@ -12,5 +17,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Antes de cargar settings: bajo ASGI las conexiones no se reusan (ver CONN_MAX_AGE)
+os.environ.setdefault('SERVIDOR_ASGI', 'True')
 
 application = get_asgi_application()
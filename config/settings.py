@@ -66,6 +66,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'admin_reorder.middleware.ModelAdminReorder',
+    'pedidos.middleware.CarritoCookieMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -94,13 +95,90 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Perfil de la BD: 'desarrollo' (por defecto) o 'produccion'.
+# En producción SQLite trabaja en WAL (los lectores no bloquean al escritor),
+# cada escritura espera su turno en vez de fallar con "database is locked" y las
+# conexiones se reusan entre requests. Los PRAGMA los aplica core/db.py al abrir
+# cada conexión. Medir con: python manage.py bench_sqlite
+DB_PERFIL = env('DB_PERFIL', default='desarrollo')
+PRODUCCION_DB = DB_PERFIL == 'produccion'
+
+SQLITE_PRAGMAS_PRODUCCION = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',         # en WAL no se corrompe; solo se pierde el último commit si cae la máquina
+    'mmap_size': 256 * 1024 * 1024,  # lecturas desde la memoria mapeada
+    'cache_size': -64000,            # 64 MB de páginas por conexión (negativo = KB)
+    'busy_timeout': 5000,            # ms esperando el candado antes de fallar
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS = SQLITE_PRAGMAS_PRODUCCION if PRODUCCION_DB else {}
+
+# Conexiones persistentes solo con WSGI, donde cada hilo atiende un request a la
+# vez y reusa la suya. Bajo ASGI quedan en hilos de asgiref que el fin del request
+# no revisa y se pueden acumular: Django recomienda desactivarlas (0).
+# config/asgi.py marca SERVIDOR_ASGI; un CONN_MAX_AGE explícito manda.
+SERVIDOR_ASGI = env.bool('SERVIDOR_ASGI', default=False)
+CONN_MAX_AGE = env.int('CONN_MAX_AGE', default=600 if PRODUCCION_DB and not SERVIDOR_ASGI else 0)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': PRODUCCION_DB,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE: la transacción toma el candado de escritura al empezar,
+            # así busy_timeout la hace esperar (con BEGIN normal SQLite falla al instante
+            # cuando una lectura intenta pasar a escritura)
+            'transaction_mode': 'IMMEDIATE',
+        } if PRODUCCION_DB else {},
     }
 }
 
+# Bases separadas (opcional): sesiones/carritos, pedidos y catálogo en archivos
+# distintos, para que un checkout o una ráfaga de clicks no bloquee el menú.
+# Ver core/routers.py. Al activarlo, migrar cada base:
+#   python manage.py migrate && python manage.py migrate --database=sesiones
+#   python manage.py migrate --database=pedidos
+DB_SEPARADAS = env.bool('DB_SEPARADAS', default=False)
+
+# Shards de pedidos (opcional, con DB_SEPARADAS): en vez de una base 'pedidos',
+# N archivos pedidos_0 ... pedidos_<N-1> y cada sede escribe solo en el suyo.
+# Por defecto la sede va al shard sede_id % N; SEDES_SHARD fija sedes concretas
+# (ej: SEDES_SHARD=1=0,4=0,7=2, sede=shard). Migrar cada shard:
+#   python manage.py migrate --database=pedidos_0   (uno por shard)
+PEDIDOS_SHARDS = env.int('PEDIDOS_SHARDS', default=0) if DB_SEPARADAS else 0
+SEDES_SHARD = {int(sede): int(shard) for sede, shard in env.dict('SEDES_SHARD', default={}).items()}
+
+if DB_SEPARADAS:
+    _principal = DATABASES['default']
+    DATABASES.update({
+        # Mismo archivo que 'default', sin permiso de escritura (lo que lee el menú)
+        'catalogo_lectura': {
+            **_principal,
+            'PRAGMAS': {'query_only': 'ON'},
+            'TEST': {'MIRROR': 'default'},
+        },
+        'sesiones': {**_principal, 'NAME': BASE_DIR / 'db_sesiones.sqlite3'},
+    })
+    if PEDIDOS_SHARDS:
+        DATABASES.update({
+            f'pedidos_{n}': {**_principal, 'NAME': BASE_DIR / f'db_pedidos_{n}.sqlite3'}
+            for n in range(PEDIDOS_SHARDS)
+        })
+    else:
+        DATABASES['pedidos'] = {**_principal, 'NAME': BASE_DIR / 'db_pedidos.sqlite3'}
+    DATABASE_ROUTERS = ['core.routers.RouterAlmacenes']
+
+
+# Cache
+# El menú se cachea por versión (catalogo/menu_cache.py). Con varios workers usa
+# un backend compartido, ej: CACHE_URL=redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -297,4 +375,19 @@ SESSION_COOKIE_SECURE = True    # Solo envía la cookie por HTTPS
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True # La sesión muere al cerrar el navegador (ideal para comida)
 
 CART_SESSION_ID = 'carrito' 
+
+# Dónde vive el carrito (ver pedidos/almacenamiento.py):
+#   pedidos.almacenamiento.AlmacenSesion  -> en la sesión (por defecto)
+#   pedidos.almacenamiento.AlmacenCache   -> en el caché CART_CACHE_ALIAS
+#   pedidos.almacenamiento.AlmacenCookie  -> cookie firmada y comprimida
+#   pedidos.almacenamiento.AlmacenTabla   -> tabla pedidos_carritoguardado
+CART_STORAGE = env('CART_STORAGE', default='pedidos.almacenamiento.AlmacenSesion')
+CART_CACHE_ALIAS = 'default'
+CART_CACHE_TIMEOUT = 60 * 60 * 24
+CART_COOKIE_NAME = 'carrito'
+CART_COOKIE_AGE = 60 * 60 * 24
+
+# Vigencia (segundos) de las claves de idempotencia del checkout. Las vencidas se
+# borran con: python manage.py purgar_claves (programarlo, ej. una vez al día)
+IDEMPOTENCIA_VIGENCIA = env.int('IDEMPOTENCIA_VIGENCIA', default=60 * 60 * 24)
 #STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
\ No newline at end of file
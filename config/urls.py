@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 
 # Importamos TODAS las vistas de pedidos (incluyendo las de catálogo y modal)
 from pedidos import views 
+from dashboard import views as dashboard_views
 
 urlpatterns = [
     # Administración y Toggle de estado (usa la vista de pedidos)
@@ -20,16 +21,30 @@ urlpatterns = [
     path('restar/<str:item_key>/', views.restar_plato, name='restar_plato'),
     path('eliminar/<str:item_key>/', views.eliminar_carrito, name='eliminar_carrito'),
     path('limpiar/', views.limpiar_carrito, name='limpiar_carrito'),
+    path('carrito/lote/', views.carrito_lote, name='carrito_lote'),
     path('carrito/', views.ver_carrito, name='ver_carrito'),
 
+    # --- SEDE DEL VISITANTE (disponibilidad de su carta) ---
+    path('sede/elegir/', views.elegir_sede, name='elegir_sede'),
+
     # --- RUTA DE CHECKOUT ---
     path('checkout/', views.iniciar_pago, name='checkout'), 
+    path('checkout/confirmar/', views.confirmar_pedido, name='confirmar_pedido'),
+
+    # --- PANTALLA DE COCINA (SSE, requiere ASGI) ---
+    path('cocina/<int:sede_id>/', views.cocina, name='cocina'),
+    path('cocina/<int:sede_id>/stream/', views.cocina_stream, name='cocina_stream'),
+
+    # --- RESUMEN GLOBAL (todas las sedes / shards) ---
+    path('dashboard/', dashboard_views.resumen_global, name='resumen_global'),
     
     # --- RUTA PARA EL MODAL (Usa views.modal_opciones de pedidos) ---
     path('modal-opciones/<int:variante_id>/', views.modal_opciones, name='cargar_modal_opciones'),
+    path('modal-opciones/categoria/<int:categoria_id>/', views.modales_categoria, name='modales_categoria'),
 
     # 3. RUTAS AJAX
     path('ajax/platos/<slug:marca_slug>/', views.ajax_platos_by_marca, name='ajax_platos_marca'),
+    path('api/menu/<slug:marca_slug>/', views.api_menu_marca, name='api_menu_marca'),
 
     # 4. RUTA DEL CATÁLOGO POR MARCA
     path('<slug:marca_slug>/', views.catalogo_por_marca, name='catalogo_marca'),
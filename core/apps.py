@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+    def ready(self):
+        import core.signals # Invalida el caché de informacion_marca
+        import core.db # PRAGMA de SQLite en cada conexión nueva
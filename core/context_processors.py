@@ -1,10 +1,36 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
 from .models import Marca, ConfiguracionVisual
 
-def informacion_marca(request):
-    """
-    Busca la MARCA ACTIVA y su CONFIGURACIÓN VISUAL (Navidad, Verano, etc.)
-    para inyectarla en el HTML.
-    """
+# El contexto de marca/tema se guarda en memoria del proceso. Para que todos los
+# workers se enteren de un cambio, la versión vive en el caché compartido
+# (core/signals.py la sube al guardar Marca o ConfiguracionVisual).
+CLAVE_VERSION = 'core:informacion_marca:version'
+_contexto_local = {'version': None, 'ctx': None}
+
+
+def _version_marca():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, int(time.time()), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _subir_version():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        _version_marca()
+
+
+def invalidar_informacion_marca():
+    """Descarta el contexto cacheado cuando la transacción actual confirme."""
+    transaction.on_commit(_subir_version)
+
+
+def _construir_contexto():
     marca = Marca.objects.filter(activo=True).first()
     
     ctx = {
@@ -24,4 +50,18 @@ def informacion_marca(request):
             ctx['TEMA_CSS'] = tema.efecto_especial
             ctx['MENSAJE_TOP'] = tema.mensaje_barra
 
-    return ctx
\ No newline at end of file
+    return ctx
+
+
+def informacion_marca(request):
+    """
+    Busca la MARCA ACTIVA y su CONFIGURACIÓN VISUAL (Navidad, Verano, etc.)
+    para inyectarla en el HTML. Solo consulta la BD cuando cambió la versión.
+    """
+    version = _version_marca()
+    if _contexto_local['version'] != version:
+        _contexto_local['ctx'] = _construir_contexto()
+        _contexto_local['version'] = version
+
+    # Copia: ningún template debe poder alterar el contexto compartido
+    return dict(_contexto_local['ctx'])
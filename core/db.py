@@ -0,0 +1,79 @@
+# core/db.py
+"""
+Ajustes de SQLite al abrir cada conexión.
+
+settings.SQLITE_PRAGMAS (vacío en desarrollo) se aplica a todas las conexiones
+SQLite; una BD puede sumar o pisar valores con la clave 'PRAGMAS' de su entrada
+en DATABASES. Con CONN_MAX_AGE la conexión se reusa, así que esto corre una
+vez por conexión y no por request.
+
+bases_temporales() da a los comandos de medición (bench_*, explain_indices)
+archivos SQLite propios y desechables.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragmas_de(settings_dict):
+    """PRAGMA que tocan a una BD: los globales más los propios de su alias."""
+    return {**getattr(settings, 'SQLITE_PRAGMAS', {}), **settings_dict.get('PRAGMAS', {})}
+
+
+@receiver(connection_created)
+def aplicar_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = pragmas_de(connection.settings_dict)
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas.items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+@contextmanager
+def bases_temporales(prefijo):
+    """
+    Apunta TODAS las conexiones (default, sesiones, pedidos o sus shards) a
+    archivos nuevos <prefijo>_<alias>.sqlite3 en una carpeta temporal, los migra
+    y al salir devuelve los NAME originales y borra la carpeta. Las BD reales no
+    se abren en ningún momento. Los espejos (TEST MIRROR) usan el archivo de su
+    alias de origen.
+    """
+    aliases = list(connections)
+    for alias in aliases:
+        if connections[alias].vendor != 'sqlite':
+            raise ImproperlyConfigured(f"'{alias}' no es SQLite: bases_temporales() solo maneja SQLite.")
+
+    originales = {alias: connections[alias].settings_dict['NAME'] for alias in aliases}
+    connections.close_all()
+    with tempfile.TemporaryDirectory(prefix=f'{prefijo}-') as carpeta:
+        espejos = {}
+        for alias in aliases:
+            # El dict es el mismo para las conexiones de otros hilos
+            datos = connections[alias].settings_dict
+            espejo = datos.get('TEST', {}).get('MIRROR')
+            if espejo:
+                espejos[alias] = espejo
+            else:
+                datos['NAME'] = os.path.join(carpeta, f'{prefijo}_{alias}.sqlite3')
+        for alias, espejo in espejos.items():
+            connections[alias].settings_dict['NAME'] = connections[espejo].settings_dict['NAME']
+        try:
+            for alias in aliases:
+                if alias not in espejos:
+                    call_command('migrate', database=alias, verbosity=0, interactive=False)
+            yield carpeta
+        finally:
+            connections.close_all()
+            for alias, nombre in originales.items():
+                connections[alias].settings_dict['NAME'] = nombre
@@ -0,0 +1,32 @@
+# core/dinero.py
+"""
+Dinero en céntimos (enteros).
+
+Dentro del carrito y del cálculo de precios los montos viajan como int en
+céntimos: se suman y multiplican sin redondeos ni parseos. Solo se convierten
+en los bordes: al leer/escribir DecimalField (a_decimal / a_centimos) y al
+responder JSON (a_json).
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+_CENTIMO = Decimal('0.01')
+
+
+def a_centimos(monto):
+    """Decimal, str o int (en soles) -> int en céntimos. None cuenta como 0."""
+    if monto is None:
+        return 0
+    if not isinstance(monto, Decimal):
+        monto = Decimal(str(monto))
+    return int(monto.quantize(_CENTIMO, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def a_decimal(centimos):
+    """int en céntimos -> Decimal en soles con 2 decimales (para DecimalField y templates)."""
+    return Decimal(centimos).scaleb(-2)
+
+
+def a_json(centimos):
+    """int en céntimos -> número para JsonResponse (solo para mostrar)."""
+    return centimos / 100
@@ -39,6 +39,7 @@ class ConfiguracionVisual(models.Model):
 
     def save(self, *args, **kwargs):
         # Si activo este tema, apago todos los demás de la misma marca
+        # (el post_save de este mismo save() invalida el caché de informacion_marca)
         if self.activo:
             ConfiguracionVisual.objects.filter(marca=self.marca).update(activo=False)
         super().save(*args, **kwargs)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Marca, ConfiguracionVisual
+from .context_processors import invalidar_informacion_marca
+
+@receiver([post_save, post_delete], sender=Marca)
+@receiver([post_save, post_delete], sender=ConfiguracionVisual)
+def invalidar_contexto_marca(sender, instance, **kwargs):
+    # ConfiguracionVisual.save() apaga los otros temas con un update() (sin señales),
+    # pero siempre termina en super().save(), que dispara este post_save.
+    invalidar_informacion_marca()
@@ -1,3 +1,93 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from catalogo.models import Plato
+from pedidos.models import CarritoGuardado, ClaveIdempotencia, DetallePedido, Pedido
+from .models import Sede
+from .routers import RouterAlmacenes, ShardIndeterminado, en_shard, shard_de_sede
+
+
+# --- REPARTO EN BASES Y SHARDS (sin tocar la BD) ---
+
+@override_settings(PEDIDOS_SHARDS=0)
+class RouterAlmacenesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = RouterAlmacenes()
+
+    def test_cada_modelo_a_su_base(self):
+        self.assertEqual(self.router.db_for_write(Pedido), 'pedidos')
+        self.assertEqual(self.router.db_for_write(DetallePedido), 'pedidos')
+        self.assertEqual(self.router.db_for_write(ClaveIdempotencia), 'pedidos')
+        self.assertEqual(self.router.db_for_write(CarritoGuardado), 'sesiones')
+        self.assertEqual(self.router.db_for_write(Plato), 'default')
+        # Sin shards la pista de sede no cambia nada: hay una sola BD de pedidos
+        self.assertEqual(self.router.db_for_write(DetallePedido, sede_id=4), 'pedidos')
+
+    def test_el_menu_se_lee_por_la_conexion_de_solo_lectura(self):
+        self.assertEqual(self.router.db_for_read(Plato), 'catalogo_lectura')
+        self.assertEqual(self.router.db_for_read(Sede), 'catalogo_lectura')
+        self.assertEqual(self.router.db_for_read(Pedido), 'pedidos')
+
+    def test_dentro_de_una_transaccion_del_staff_se_lee_de_default(self):
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Plato), 'default')
+
+    def test_migraciones(self):
+        self.assertTrue(self.router.allow_migrate('pedidos', 'pedidos', 'pedido'))
+        self.assertFalse(self.router.allow_migrate('default', 'pedidos', 'pedido'))
+        self.assertTrue(self.router.allow_migrate('sesiones', 'pedidos', 'carritoguardado'))
+        self.assertTrue(self.router.allow_migrate('sesiones', 'sessions', 'session'))
+        self.assertFalse(self.router.allow_migrate('catalogo_lectura', 'catalogo', 'plato'))
+
+
+@override_settings(PEDIDOS_SHARDS=3, SEDES_SHARD={1: 2})
+class ShardsPedidosTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = RouterAlmacenes()
+
+    def test_shard_por_sede(self):
+        self.assertEqual(shard_de_sede(4), 'pedidos_1')
+        self.assertEqual(shard_de_sede(6), 'pedidos_0')
+        # SEDES_SHARD fija la sede a un shard concreto
+        self.assertEqual(shard_de_sede(1), 'pedidos_2')
+
+    def test_pista_de_sede(self):
+        self.assertEqual(self.router.db_for_write(Pedido, sede_id=4), 'pedidos_1')
+        self.assertEqual(self.router.db_for_read(ClaveIdempotencia, sede_id=5), 'pedidos_2')
+
+    def test_pista_de_instancia(self):
+        pedido = Pedido(sede_id=5)
+        self.assertEqual(self.router.db_for_write(Pedido, instance=pedido), 'pedidos_2')
+        # Una línea va con su pedido
+        linea = DetallePedido(pedido=pedido)
+        self.assertEqual(self.router.db_for_write(DetallePedido, instance=linea), 'pedidos_2')
+        # sede.pedidos.all()
+        self.assertEqual(self.router.db_for_read(Pedido, instance=Sede(pk=4)), 'pedidos_1')
+
+    def test_instancia_leida_de_un_shard(self):
+        pedido = Pedido(sede_id=4)
+        pedido._state.db = 'pedidos_0'
+        self.assertEqual(self.router.db_for_read(DetallePedido, instance=pedido), 'pedidos_0')
+
+    def test_sin_pista_no_se_adivina(self):
+        with self.assertRaises(ShardIndeterminado):
+            self.router.db_for_read(Pedido)
+        with en_shard('pedidos_1'):
+            self.assertEqual(self.router.db_for_read(Pedido), 'pedidos_1')
+        with self.assertRaises(ShardIndeterminado):
+            self.router.db_for_write(DetallePedido)
+
+    def test_modelos_fuera_de_los_shards(self):
+        self.assertEqual(self.router.db_for_write(CarritoGuardado), 'sesiones')
+        self.assertEqual(self.router.db_for_write(Plato), 'default')
+
+    def test_migraciones(self):
+        self.assertTrue(self.router.allow_migrate('pedidos_0', 'pedidos', 'pedido'))
+        self.assertFalse(self.router.allow_migrate('pedidos_0', 'catalogo', 'plato'))
+        self.assertFalse(self.router.allow_migrate('pedidos', 'pedidos', 'pedido'))
+        self.assertTrue(self.router.allow_migrate('sesiones', 'pedidos', 'carritoguardado'))
+        self.assertFalse(self.router.allow_migrate('catalogo_lectura', 'catalogo', 'plato'))
@@ -1,3 +1,25 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+# La de solo lectura es un espejo de 'default' en los tests (ver pedidos/tests.py)
+BASES = set(settings.DATABASES) - {'catalogo_lectura'}
+
+
+class ResumenGlobalTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'a@a.pe', 'clave'))
+
+    def test_dias_se_acota(self):
+        casos = {'': 1, 'abc': 1, '²': 1, '-3': 1, '0': 1, '7': 7, '99999999': 365}
+        # Los shards no importan aquí: solo la ventana pedida
+        with mock.patch('dashboard.views.en_cada_bd', return_value={}):
+            for valor, esperado in casos.items():
+                with self.subTest(dias=valor):
+                    respuesta = self.client.get('/dashboard/', {'dias': valor})
+                    self.assertEqual(respuesta.status_code, 200)
+                    self.assertEqual(respuesta.context['dias'], esperado)
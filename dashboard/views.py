@@ -1,3 +1,67 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count, Sum
 from django.shortcuts import render
+from django.utils import timezone
+
+from core.models import Sede
+from pedidos.models import Pedido, ESTADOS_FINALES
+from pedidos.shards import en_cada_bd
+
+# Ventana máxima del resumen (?dias=): más atrás es un reporte, no un tablero
+MAX_DIAS = 365
+
+
+def _resumen_bd(alias, desde):
+    """Pedidos por sede y estado de UNA base de pedidos (un GROUP BY)."""
+    return list(
+        Pedido.objects.using(alias)
+        .filter(fecha_creacion__gte=desde)
+        .values('sede_id', 'estado')
+        .annotate(pedidos=Count('id'), total=Sum('total'))
+        .order_by()
+    )
+
+
+@staff_member_required
+def resumen_global(request):
+    """Ventas y pedidos de todas las sedes, sumando cada shard de pedidos."""
+    try:
+        dias = min(max(int(request.GET.get('dias', 1)), 1), MAX_DIAS)
+    except ValueError:
+        dias = 1
+    desde = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=dias - 1)
+
+    por_bd = en_cada_bd(lambda alias: _resumen_bd(alias, desde))
+
+    sedes = {sede.id: sede for sede in Sede.objects.all()}
+    filas = {}
+    for alias, grupos in por_bd.items():
+        for grupo in grupos:
+            fila = filas.setdefault(grupo['sede_id'], {
+                'sede': sedes.get(grupo['sede_id']),
+                'bd': alias,
+                'pedidos': 0,
+                'activos': 0,
+                'cancelados': 0,
+                'ventas': Decimal('0.00'),
+            })
+            fila['pedidos'] += grupo['pedidos']
+            if grupo['estado'] == 'CANCELADO':
+                fila['cancelados'] += grupo['pedidos']
+            else:
+                fila['ventas'] += grupo['total'] or 0
+            if grupo['estado'] not in ESTADOS_FINALES:
+                fila['activos'] += grupo['pedidos']
 
-# Create your views here.
+    filas = sorted(filas.values(), key=lambda fila: fila['ventas'], reverse=True)
+    return render(request, 'dashboard/resumen.html', {
+        'filas': filas,
+        'dias': dias,
+        'desde': desde,
+        'bds': len(por_bd),
+        'total_pedidos': sum(fila['pedidos'] for fila in filas),
+        'total_ventas': sum((fila['ventas'] for fila in filas), Decimal('0.00')),
+    })
@@ -1,5 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.urls import reverse
+from core.models import Sede
+from core.routers import en_shard, shards_pedidos
 from .models import Pedido, DetallePedido
+from .signals import totales_diferidos
+from .shards import bd_de_sede
+from django.http import QueryDict
 # Register your models here.
 
 class DetalleInline(admin.TabularInline):
@@ -13,3 +20,64 @@ class PedidoAdmin(admin.ModelAdmin):
     list_filter = ('sede', 'estado', 'fecha_creacion')
     search_fields = ('nombre_contacto', 'id')
     inlines = [DetalleInline] # Muestra los platos dentro del pedido
+
+    # Con shards (pedidos/shards.py) cada sede tiene su BD y los ids se repiten
+    # entre ellas: el admin trabaja UNA sede a la vez. La lista exige el filtro
+    # de sede y el filtro viaja en _changelist_filters al abrir, guardar o borrar
+    # un pedido, así que cada vista lee y escribe en el shard de esa sede.
+    def _sede_filtrada(self, request):
+        filtros = QueryDict(request.GET.get('_changelist_filters', ''))
+        sede_id = request.GET.get('sede__id__exact') or filtros.get('sede__id__exact')
+        try:
+            return int(sede_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _en_shard_de_sede(self, request, vista, *args, **kwargs):
+        if not shards_pedidos():
+            return vista(request, *args, **kwargs)
+        sede_id = self._sede_filtrada(request)
+        if sede_id is None:
+            primera = Sede.objects.order_by('id').values_list('id', flat=True).first()
+            if request.resolver_match.url_name != 'pedidos_pedido_changelist':
+                self.message_user(request, 'Elige primero la sede del pedido.', messages.WARNING)
+            lista = reverse('admin:pedidos_pedido_changelist')
+            return redirect(f'{lista}?sede__id__exact={primera}' if primera else lista)
+        with en_shard(bd_de_sede(sede_id)):
+            respuesta = vista(request, *args, **kwargs)
+            # El template se renderiza aquí: sus consultas también van a este shard
+            if hasattr(respuesta, 'render'):
+                respuesta.render()
+            return respuesta
+
+    def changelist_view(self, request, extra_context=None):
+        return self._en_shard_de_sede(request, super().changelist_view, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return self._en_shard_de_sede(request, super().changeform_view, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self._en_shard_de_sede(request, super().delete_view, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self._en_shard_de_sede(request, super().history_view, object_id, extra_context)
+
+    # La sede puede estar en otra BD (core/routers.py): prefetch, no JOIN
+    list_select_related = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).prefetch_related('sede')
+        sede_id = self._sede_filtrada(request)
+        return queryset.using(bd_de_sede(sede_id)) if sede_id else queryset
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if obj._state.db:
+            # Las líneas se leen de la misma BD que el pedido
+            kwargs['queryset'] = kwargs['queryset'].using(obj._state.db)
+        return kwargs
+
+    def save_related(self, request, form, formsets, change):
+        # Las líneas del inline no tocan el total una por una: se recalcula una vez al confirmar
+        with totales_diferidos():
+            super().save_related(request, form, formsets, change)
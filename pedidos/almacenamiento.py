@@ -0,0 +1,158 @@
+# pedidos/almacenamiento.py
+"""
+Dónde se guarda el carrito. Carrito solo habla con un "almacén" que sabe
+cargar(), guardar() y limpiar() un diccionario JSON.
+
+Se elige en settings.CART_STORAGE (ruta a la clase):
+
+- AlmacenSesion: el de siempre, dentro de la sesión de Django.
+- AlmacenCache:  en el caché (LRU en memoria o Redis), fuera de la sesión.
+- AlmacenCookie: en una cookie firmada y comprimida (sin escrituras en servidor).
+- AlmacenTabla:  en una tabla propia y liviana (pedidos.CarritoGuardado).
+
+Los almacenes de caché y tabla identifican el carrito con un token que se
+guarda en la sesión UNA sola vez (al crear el carrito); desde ahí, cada click
+escribe solo el carrito, no la fila completa de la sesión.
+"""
+
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+class AlmacenCarrito:
+    """Interfaz base. Los datos son siempre un dict serializable a JSON."""
+
+    def __init__(self, request):
+        self.request = request
+
+    def cargar(self):
+        raise NotImplementedError
+
+    def guardar(self, datos):
+        raise NotImplementedError
+
+    def limpiar(self):
+        raise NotImplementedError
+
+
+class AlmacenSesion(AlmacenCarrito):
+    """El carrito vive en la sesión (cada cambio reescribe la sesión entera)."""
+
+    def cargar(self):
+        return self.request.session.get(settings.CART_SESSION_ID) or {}
+
+    def guardar(self, datos):
+        self.request.session[settings.CART_SESSION_ID] = datos
+        self.request.session.modified = True
+
+    def limpiar(self):
+        if settings.CART_SESSION_ID in self.request.session:
+            del self.request.session[settings.CART_SESSION_ID]
+
+
+class _AlmacenConToken(AlmacenCarrito):
+    """Base para almacenes externos: el token del carrito se guarda en la sesión."""
+
+    CLAVE_TOKEN = 'carrito_token'
+
+    def _token(self, crear=False):
+        token = self.request.session.get(self.CLAVE_TOKEN)
+        if token is None and crear:
+            token = uuid.uuid4().hex
+            self.request.session[self.CLAVE_TOKEN] = token
+        return token
+
+
+class AlmacenCache(_AlmacenConToken):
+    """
+    El carrito vive en el caché settings.CART_CACHE_ALIAS.
+    Con LocMemCache es un LRU por proceso (solo sirve con un worker);
+    con varios workers usa un caché compartido (Redis/Memcached).
+    """
+
+    def _cache(self):
+        return caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+
+    def _clave(self, token):
+        return f'carrito:{token}'
+
+    def cargar(self):
+        token = self._token()
+        if token is None:
+            return {}
+        return self._cache().get(self._clave(token)) or {}
+
+    def guardar(self, datos):
+        token = self._token(crear=True)
+        timeout = getattr(settings, 'CART_CACHE_TIMEOUT', 60 * 60 * 24)
+        self._cache().set(self._clave(token), datos, timeout=timeout)
+
+    def limpiar(self):
+        token = self._token()
+        if token is not None:
+            self._cache().delete(self._clave(token))
+
+
+class AlmacenCookie(AlmacenCarrito):
+    """
+    El carrito viaja en una cookie firmada (no se puede alterar) y comprimida.
+    La cookie la escribe pedidos.middleware.CarritoCookieMiddleware en la respuesta.
+    Límite práctico: ~4 KB por cookie (unas decenas de líneas).
+    """
+
+    SALT = 'pedidos.carrito'
+
+    def _nombre_cookie(self):
+        return getattr(settings, 'CART_COOKIE_NAME', 'carrito')
+
+    def cargar(self):
+        valor = self.request.COOKIES.get(self._nombre_cookie())
+        if not valor:
+            return {}
+        try:
+            return signing.loads(valor, salt=self.SALT)
+        except signing.BadSignature:
+            return {}
+
+    def guardar(self, datos):
+        self.request._carrito_cookie = signing.dumps(datos, salt=self.SALT, compress=True)
+
+    def limpiar(self):
+        self.request._carrito_cookie = ''
+
+
+class AlmacenTabla(_AlmacenConToken):
+    """El carrito vive en pedidos.CarritoGuardado: cada cambio es un UPDATE de una fila chica."""
+
+    def cargar(self):
+        from .models import CarritoGuardado
+        token = self._token()
+        if token is None:
+            return {}
+        datos = CarritoGuardado.objects.filter(token=token).values_list('datos', flat=True).first()
+        return datos or {}
+
+    def guardar(self, datos):
+        from .models import CarritoGuardado
+        token = self._token(crear=True)
+        actualizados = CarritoGuardado.objects.filter(token=token).update(
+            datos=datos, actualizado=timezone.now()
+        )
+        if not actualizados:
+            CarritoGuardado.objects.create(token=token, datos=datos)
+
+    def limpiar(self):
+        from .models import CarritoGuardado
+        token = self._token()
+        if token is not None:
+            CarritoGuardado.objects.filter(token=token).delete()
+
+
+def obtener_almacen(request):
+    """Instancia el almacén configurado en settings.CART_STORAGE."""
+    ruta = getattr(settings, 'CART_STORAGE', 'pedidos.almacenamiento.AlmacenSesion')
+    return import_string(ruta)(request)
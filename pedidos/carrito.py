@@ -1,18 +1,126 @@
 # pedidos/carrito.py
 
+import copy
 import hashlib
-from decimal import Decimal
-from django.conf import settings
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from catalogo.menu_cache import mascara_sede, disponible_en
 from catalogo.models import Variante, Opcion 
+from core.dinero import a_centimos, a_decimal
+from core.models import Sede
+from .almacenamiento import obtener_almacen
+from .checkout import ESTADOS_SIN_PEDIDOS
+
+# Sede elegida por el visitante: define qué está agotado en su carta y carrito
+SESION_SEDE = 'sede_id'
+# Versión del formato guardado; lo anterior se migra UNA vez al leerlo
+FORMATO_CARRITO = 2
+
+
+# Sede de quien aún no eligió; pedidos/signals.py la borra al cambiar una Sede
+CLAVE_SEDE_POR_DEFECTO = 'pedidos:sede_por_defecto'
+
+
+def sede_por_defecto():
+    """
+    La primera sede que recibe pedidos (o la primera, si ninguna recibe).
+    None si no hay sedes. Se consulta una vez y queda en el caché compartido.
+    """
+    sede_id = cache.get(CLAVE_SEDE_POR_DEFECTO)
+    if sede_id is None:
+        sedes = Sede.objects.order_by('id').values_list('id', flat=True)
+        sede_id = sedes.exclude(estado_actual__in=ESTADOS_SIN_PEDIDOS).first() or sedes.first()
+        # 0 = no hay sedes (None no se distingue de "no está en el caché")
+        cache.set(CLAVE_SEDE_POR_DEFECTO, sede_id or 0, timeout=None)
+    return sede_id or None
+
+
+def sede_visitante(request):
+    """
+    ID de la sede del visitante: la que eligió (sesión) o, si aún no eligió,
+    la sede por defecto. None si no hay sedes.
+    """
+    sede_id = request.session.get(SESION_SEDE)
+    if sede_id is not None:
+        return sede_id
+    return sede_por_defecto()
+
 
 class Carrito:
     def __init__(self, request):
-        self.session = request.session
-        # Usamos settings.CART_SESSION_ID (debe estar definido en settings.py)
-        self.carrito = self.session.get(settings.CART_SESSION_ID) 
-        if not self.carrito:
-            self.carrito = self.session[settings.CART_SESSION_ID] = {}
+        # El almacén (sesión, caché, cookie o tabla) se elige en settings.CART_STORAGE
+        self.almacen = obtener_almacen(request)
+        # Solo LEEMOS: el carrito se escribe recién en guardar(),
+        # así una visita que no compra no genera escrituras.
+        self._migrado = False
+        self.carrito, self.resumen = self._desempaquetar(self.almacen.cargar())
         self.request = request
+        # Dentro de lote() los cambios se acumulan y se guardan una sola vez
+        self._en_lote = False
+        self._pendiente = False
+        if self._migrado:
+            self.guardar()
+
+    @cached_property
+    def sede_id(self):
+        """Sede contra la que se revisa la disponibilidad (ver sede_visitante)."""
+        return sede_visitante(self.request)
+
+    def disponibles(self):
+        """Bitset de variantes disponibles en la sede del visitante (catalogo/menu_cache.py)."""
+        return mascara_sede(self.sede_id)
+
+    # --- FORMATO GUARDADO Y TOTALES ACUMULADOS ---
+    # En el almacén se guarda {'formato': 2, 'items': {...}, 'resumen': {...}}. El resumen lleva
+    # los totales ya calculados y se ajusta en O(1) con cada cambio, así que
+    # leer totales nunca recorre el carrito.
+
+    @staticmethod
+    def _resumen_vacio():
+        return {'cantidad': 0, 'total_centimos': 0, 'por_variante': {}}
+
+    @staticmethod
+    def _centimos_linea(item):
+        """Aporte de una línea al total, en céntimos (entero)."""
+        return item.get('precio_centimos', 0) * item.get('cantidad', 0)
+
+    @staticmethod
+    def _normalizar_items(items):
+        """Líneas guardadas con 'precio_unitario' (texto en soles) pasan a céntimos."""
+        for item in items.values():
+            if 'precio_centimos' not in item:
+                item['precio_centimos'] = a_centimos(item.pop('precio_unitario', 0))
+        return items
+
+    def _desempaquetar(self, datos):
+        if datos.get('formato') == FORMATO_CARRITO:
+            return datos['items'], datos['resumen']
+
+        # Formatos anteriores (solo las líneas, o sin versión): precios a céntimos y
+        # resumen recalculado. __init__ lo guarda ya migrado para no repetirlo
+        items = self._normalizar_items(datos['items'] if 'resumen' in datos else datos)
+        self.resumen = self._resumen_vacio()
+        for item in items.values():
+            self._acumular(item, 1)
+        self._migrado = bool(items)
+        return items, self.resumen
+
+    def _acumular(self, item, signo):
+        """Suma (signo=1) o resta (signo=-1) el aporte de una línea al resumen."""
+        cantidad = item.get('cantidad', 0) * signo
+        self.resumen['cantidad'] += cantidad
+        self.resumen['total_centimos'] += self._centimos_linea(item) * signo
+
+        if not item.get('variante_id'):
+            return
+        por_variante = self.resumen['por_variante']
+        variante = str(item['variante_id'])
+        restante = por_variante.get(variante, 0) + cantidad
+        if restante > 0:
+            por_variante[variante] = restante
+        else:
+            por_variante.pop(variante, None)
 
     def _generar_item_key(self, variante_id, opciones_ids=None, notas=''):
         """Genera una clave única (item_key) para el ítem,
@@ -36,13 +144,13 @@ class Carrito:
         # 3. Formato final: ID_VARIANTE-HASH_OPCIONES
         return f"{variante_id}-{hash_hex}"
 
-    def agregar(self, variante_id, cantidad=1, precio_unitario=None, opciones_ids=None, notas=''):
-        """Agrega un ítem usando item_key."""
+    def agregar(self, variante_id, cantidad=1, precio_centimos=None, opciones_ids=None, notas=''):
+        """Agrega un ítem usando item_key y devuelve esa clave. El precio va en céntimos (int)."""
             
         item_key = self._generar_item_key(variante_id, opciones_ids, notas)
         
         if item_key not in self.carrito:
-            if precio_unitario is None:
+            if precio_centimos is None:
                 # Si es un nuevo ítem, el precio unitario es obligatorio
                 raise ValueError("Precio unitario es requerido para un nuevo ítem.")
             
@@ -50,22 +158,27 @@ class Carrito:
             self.carrito[item_key] = {
                 'variante_id': variante_id, 
                 'cantidad': 0,
-                'precio_unitario': str(precio_unitario), # Guardar como string
+                'precio_centimos': precio_centimos, # Entero: sin parseos al leer
                 'opciones': opciones_ids if opciones_ids else [],
                 'notas': notas.strip()
             }
         
         # Si ya existe, actualiza el precio (solo en caso de ser llamado desde agregar_carrito)
-        elif precio_unitario is not None:
-             self.carrito[item_key]['precio_unitario'] = str(precio_unitario)
+        elif precio_centimos is not None:
+             self._acumular(self.carrito[item_key], -1)
+             self.carrito[item_key]['precio_centimos'] = precio_centimos
+             self._acumular(self.carrito[item_key], 1)
 
         self.carrito[item_key]['cantidad'] += cantidad
+        self._acumular({**self.carrito[item_key], 'cantidad': cantidad}, 1)
         self.guardar()
+        return item_key
 
     def restar(self, item_key):
         """Resta una unidad del ítem del carrito, o lo elimina si la cantidad es 1."""
         if item_key in self.carrito:
             self.carrito[item_key]['cantidad'] -= 1
+            self._acumular({**self.carrito[item_key], 'cantidad': 1}, -1)
             
             if self.carrito[item_key]['cantidad'] <= 0:
                 self.eliminar(item_key)
@@ -75,60 +188,100 @@ class Carrito:
     def eliminar(self, item_key):
         """Elimina completamente el ítem del carrito, usando el item_key."""
         if item_key in self.carrito:
-            del self.carrito[item_key]
+            self._acumular(self.carrito.pop(item_key), -1)
             self.guardar()
 
     def guardar(self):
-        """Marca la sesión como modificada para que se guarde."""
-        self.session.modified = True
+        """Persiste el carrito en el almacén configurado (diferido dentro de lote())."""
+        if self._en_lote:
+            self._pendiente = True
+            return
+        self.almacen.guardar(
+            {'formato': FORMATO_CARRITO, 'items': self.carrito, 'resumen': self.resumen}
+        )
 
-    def limpiar(self):
-        """Elimina el carrito de la sesión."""
-        if self.carrito:
-            del self.session[settings.CART_SESSION_ID]
+    @contextmanager
+    def lote(self):
+        """
+        Aplica varias operaciones como una sola: se guarda una vez al final y,
+        si alguna falla (excepción), el carrito vuelve a como estaba.
+        """
+        if self._en_lote:
+            yield self
+            return
+
+        respaldo = copy.deepcopy((self.carrito, self.resumen))
+        self._en_lote = True
+        self._pendiente = False
+        try:
+            yield self
+        except Exception:
+            self.carrito, self.resumen = respaldo
+            self._en_lote = False
+            if self._pendiente:
+                # AlmacenSesion guarda los mismos dicts que se modificaron: se le
+                # devuelve la copia o la sesión conservaría los cambios a medias
+                self._pendiente = False
+                self.guardar()
+            raise
+        finally:
+            self._en_lote = False
+
+        if self._pendiente:
+            self._pendiente = False
             self.guardar()
 
+    def limpiar(self):
+        """Elimina el carrito del almacén."""
+        self.almacen.limpiar()
+        self.carrito = {}
+        self.resumen = self._resumen_vacio()
+
     # --- MÉTODOS DE CÁLCULO Y LECTURA ---
     
     def __len__(self):
         """Devuelve el número total de ítems (productos) en el carrito, contando la cantidad."""
-        return sum(item.get('cantidad', 0) for item in self.carrito.values())
+        return self.resumen['cantidad']
         
     def get_total_items(self):
         """Alias para __len__ para claridad. (ESTE ES EL MÉTODO FALTANTE)"""
         return len(self)
 
+    def get_total_centimos(self):
+        """Costo total del carrito en céntimos, leído del resumen."""
+        return self.resumen['total_centimos']
+
     def get_total_precio(self):
-        """Calcula el costo total de todos los ítems en el carrito."""
-        total = Decimal(0)
-        for item in self.carrito.values():
-            precio_str = item.get('precio_unitario', '0.00')
-            cantidad = item.get('cantidad', 0)
-            
-            try:
-                precio = Decimal(precio_str)
-                total += precio * cantidad
-            except (ValueError, TypeError):
-                # Manejo de error si el precio no es convertible a Decimal
-                pass 
-                
-        return total
+        """Costo total del carrito en soles (Decimal), para templates y DecimalField."""
+        return a_decimal(self.resumen['total_centimos'])
 
     
-    def iterar_detalles(self):
+    def iterar_detalles(self, keys=None):
         """
         Genera los items del carrito usando objetos directos para evitar KeyError.
+        Con 'keys' solo genera esas líneas (para las respuestas delta).
         """
+        if keys is None:
+            items = self.carrito
+        else:
+            items = {key: self.carrito[key] for key in keys if key in self.carrito}
+
         # 1. Obtener IDs de variantes
-        variante_ids = [item['variante_id'] for item in self.carrito.values() if item.get('variante_id')]
+        variante_ids = [item['variante_id'] for item in items.values() if item.get('variante_id')]
         
-        # Traemos las variantes con su plato
-        variantes = Variante.objects.filter(id__in=variante_ids).select_related('plato')
+        # Traemos las variantes con su plato y las inclusiones que pinta el ticket;
+        # la disponibilidad sale del bitset de la sede (0 queries)
+        variantes = (
+            Variante.objects.filter(id__in=variante_ids)
+            .select_related('plato')
+            .prefetch_related('inclusiones')
+        )
         variantes_dict = {v.id: v for v in variantes}
+        mascara = self.disponibles()
 
         # 2. Obtener IDs de todas las opciones en el carrito
         all_opcion_ids = []
-        for item in self.carrito.values():
+        for item in items.values():
             opciones_ids = item.get('opciones', [])
             if opciones_ids:
                 all_opcion_ids.extend(opciones_ids)
@@ -142,7 +295,7 @@ class Carrito:
             opciones_dict = {}
 
         # 4. Iterar sobre el carrito de sesión
-        for key, item in self.carrito.items():
+        for key, item in items.items():
             variante_id = item.get('variante_id')
             
             # Si la variante ya no existe en BD, saltamos
@@ -151,10 +304,10 @@ class Carrito:
 
             producto = variantes_dict[variante_id]
             
-            # Calcular precios (asegurando tipos de datos)
-            precio_base = Decimal(str(item['precio_unitario']))
+            # Los precios se guardan en céntimos; el template recibe soles (Decimal)
             cantidad = int(item['cantidad'])
-            subtotal = precio_base * cantidad
+            precio_base = a_decimal(item['precio_centimos'])
+            subtotal = a_decimal(item['precio_centimos'] * cantidad)
 
             # 5. Construir la lista de opciones para el template
             # Usamos el nombre plural 'opciones_detalles' para coincidir con tu HTML
@@ -180,6 +333,7 @@ class Carrito:
             yield {
                 'key': key,
                 'producto': producto,
+                'disponible': disponible_en(mascara, variante_id),
                 'cantidad': cantidad,
                 'precio_unitario': precio_base,
                 'subtotal': subtotal,
@@ -189,14 +343,14 @@ class Carrito:
 
     def get_variante_ids(self):
         """Devuelve una lista de los IDs de las variantes originales para checkear disponibilidad."""
-        return list(set(item.get('variante_id') for item in self.carrito.values() if item.get('variante_id')))
+        return [int(variante_id) for variante_id in self.resumen['por_variante']]
         
     def get_cantidad_de_variante(self, variante_id):
         """Devuelve la cantidad total de UNA variante (sin importar las opciones)
             para el badge en el menú.
         """
-        total_qty = 0
-        for item in self.carrito.values():
-            if item.get('variante_id') == variante_id: 
-                total_qty += item.get('cantidad', 0) 
-        return total_qty
\ No newline at end of file
+        return self.resumen['por_variante'].get(str(variante_id), 0)
+
+    def get_cantidades_por_variante(self):
+        """{variante_id (str): cantidad} de todo el carrito, para los badges de la carta."""
+        return dict(self.resumen['por_variante'])
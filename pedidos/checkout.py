@@ -0,0 +1,173 @@
+# pedidos/checkout.py
+"""
+Convierte un Carrito en un Pedido.
+
+Todo el carrito se vuelve a cotizar contra tabla_precios() y la disponibilidad
+de la sede elegida (mascara_sede), ambas en memoria, y el
+Pedido se crea con TODAS sus líneas en un solo bulk_create, dentro de una
+transacción. El total se calcula una vez en Python: bulk_create no dispara
+las señales de DetallePedido, así que no hay un recálculo por línea.
+
+Queries por checkout: constantes (nombres de opciones, INSERT del pedido,
+INSERT de las líneas), sin importar cuántas líneas tenga el carrito.
+
+Los reintentos se reconocen por una clave de idempotencia (ClaveIdempotencia),
+vigente durante settings.IDEMPOTENCIA_VIGENCIA (ver purgar_claves).
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from catalogo.menu_cache import tabla_precios, mascara_sede, disponible_en
+from catalogo.models import Opcion
+from catalogo.seleccion import SeleccionInvalida
+from core.dinero import a_decimal
+from .models import Pedido, DetallePedido, ClaveIdempotencia
+from .shards import bd_de_sede, bds_pedidos
+
+# Sedes que hoy no reciben pedidos (semáforo de Sede.estado_actual)
+ESTADOS_SIN_PEDIDOS = ('PAUSA', 'CERRADO')
+
+
+class PedidoInvalido(Exception):
+    """El carrito no se puede convertir en pedido (mensaje listo para el cliente)."""
+
+
+def cotizar_carrito(carrito, sede_id):
+    """
+    Vuelve a cotizar cada línea con los precios vigentes y revisa que esté
+    disponible en la sede que atenderá el pedido.
+    Devuelve [(item, precio_centimos), ...] o lanza PedidoInvalido.
+    """
+    if not carrito.carrito:
+        raise PedidoInvalido('Tu carrito está vacío.')
+
+    fichas = tabla_precios()
+    mascara = mascara_sede(sede_id)
+    lineas = []
+    for item in carrito.carrito.values():
+        ficha = fichas.get(item['variante_id'])
+        if ficha is None or not disponible_en(mascara, item['variante_id']):
+            raise PedidoInvalido('Elimina los ítems agotados para continuar.')
+        try:
+            extra = ficha['validador'].extra_de(item.get('opciones', []))
+        except SeleccionInvalida as error:
+            raise PedidoInvalido(str(error))
+        lineas.append((item, ficha['precio_centimos'] + extra))
+    return lineas
+
+
+def _notas_linea(item, nombres_opciones):
+    """DetallePedido no tiene opciones propias: van al inicio de las notas."""
+    partes = [nombres_opciones[o] for o in item.get('opciones', []) if o in nombres_opciones]
+    notas = ', '.join(partes)
+    if item.get('notas'):
+        notas = f"{notas} | {item['notas']}" if notas else item['notas']
+    return notas[:200]
+
+
+# --- IDEMPOTENCIA ---
+
+def huella_pedido(sede, datos):
+    """Resumen estable de lo que se pidió crear (sede + datos del formulario)."""
+    contenido = json.dumps({'sede': sede.id, **datos}, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def _inicio_vigencia():
+    """Las claves creadas antes de este momento ya vencieron."""
+    return timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_VIGENCIA)
+
+
+def _pedido_previo(clave, huella, bd):
+    """
+    Pedido ya creado con esta clave vigente (o None). La misma clave con otros
+    datos es un error.
+    """
+    registro = ClaveIdempotencia.objects.using(bd).select_related('pedido').filter(
+        clave=clave, creado__gte=_inicio_vigencia()
+    ).first()
+    if registro is None:
+        return None
+    if registro.huella != huella:
+        raise PedidoInvalido('Esta solicitud ya se usó para otro pedido. Recarga la página.')
+    registro.pedido.repetido = True
+    return registro.pedido
+
+
+def purgar_claves():
+    """
+    Borra las claves de idempotencia más viejas que IDEMPOTENCIA_VIGENCIA en
+    cada BD de pedidos. Devuelve cuántas se borraron.
+    """
+    limite = _inicio_vigencia()
+    borradas = 0
+    for bd in bds_pedidos():
+        borradas += ClaveIdempotencia.objects.using(bd).filter(creado__lt=limite).delete()[0]
+    return borradas
+
+
+def crear_pedido(carrito, sede, clave=None, **datos):
+    """
+    Crea el Pedido y sus DetallePedido a partir del carrito y lo vacía.
+    'datos' son campos de Pedido (nombre_contacto, telefono_contacto,
+    tipo_servicio, direccion_entrega, metodo_pago...).
+
+    Con 'clave' (idempotencia) un reintento devuelve el pedido original, aunque
+    el carrito ya esté vacío. Dos peticiones simultáneas con la misma clave
+    chocan en el índice único: la que pierde devuelve el pedido de la otra.
+    """
+    # Pedido, líneas y clave van a la BD (o shard) de la sede: ver pedidos/shards.py
+    bd = bd_de_sede(sede.id)
+    if clave:
+        huella = huella_pedido(sede, datos)
+        previo = _pedido_previo(clave, huella, bd)
+        if previo is not None:
+            return previo
+
+    if sede.estado_actual in ESTADOS_SIN_PEDIDOS:
+        raise PedidoInvalido(f'{sede.nombre} no está recibiendo pedidos en este momento.')
+
+    lineas = cotizar_carrito(carrito, sede.id)
+    total = sum(precio * item['cantidad'] for item, precio in lineas)
+
+    ids_opciones = {o for item, _ in lineas for o in item.get('opciones', [])}
+    nombres_opciones = dict(
+        Opcion.objects.filter(id__in=ids_opciones).values_list('id', 'nombre')
+    ) if ids_opciones else {}
+
+    try:
+        with transaction.atomic(using=bd):
+            if clave:
+                # Una clave vencida que aún no purgó purgar_claves se puede volver a usar
+                ClaveIdempotencia.objects.using(bd).filter(
+                    clave=clave, creado__lt=_inicio_vigencia()
+                ).delete()
+                # Se reserva la clave primero: si otra petición ya la tiene, falla aquí
+                registro = ClaveIdempotencia.objects.using(bd).create(clave=clave, huella=huella)
+            pedido = Pedido.objects.using(bd).create(sede=sede, total=a_decimal(total), **datos)
+            DetallePedido.objects.using(bd).bulk_create([
+                DetallePedido.desde_centimos(
+                    pedido,
+                    item['variante_id'],
+                    item['cantidad'],
+                    precio,
+                    notas=_notas_linea(item, nombres_opciones),
+                )
+                for item, precio in lineas
+            ])
+            if clave:
+                registro.pedido = pedido
+                registro.save(update_fields=['pedido'])
+    except IntegrityError:
+        previo = _pedido_previo(clave, huella, bd) if clave else None
+        if previo is None:
+            raise
+        return previo
+
+    carrito.limpiar()
+    pedido.repetido = False
+    return pedido
@@ -0,0 +1,186 @@
+# pedidos/cocina.py
+"""
+Pantalla de cocina (KDS) en vivo por Server-Sent Events.
+
+Un solo Publicador por proceso consulta la BD cada INTERVALO segundos
+("¿qué pedidos cambiaron desde la última vuelta?", vía
+Pedido.fecha_actualizacion) y reparte los cambios a las pantallas suscritas
+a cada sede. Da igual si hay 1 o 40 pantallas abiertas: es UNA consulta por
+vuelta, no una por cliente. El bucle arranca con la primera suscripción y se
+detiene cuando se va la última.
+
+Necesita ASGI (config/asgi.py): bajo WSGI cada pantalla ocuparía un hilo
+para siempre.
+"""
+
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Pedido
+from .shards import agrupar_por_bd, bd_de_sede
+
+INTERVALO = 1.0
+# Cada pantalla recibe un comentario cada LATIDO segundos para que los proxies no corten
+LATIDO = 15
+# Un pedido que confirma su transacción tarde puede traer una fecha_actualizacion
+# anterior al cursor: se relee este margen hacia atrás y se descartan repetidos
+MARGEN = timedelta(seconds=5)
+# Eventos en espera por pantalla; una pantalla más lenta que esto se resincroniza
+MAX_PENDIENTES = 200
+
+
+def _pedidos_a_dict(pedidos):
+    return [
+        {
+            'id': p.id,
+            'sede_id': p.sede_id,
+            'estado': p.estado,
+            'estado_texto': p.get_estado_display(),
+            'tipo_servicio': p.get_tipo_servicio_display(),
+            'nombre_contacto': p.nombre_contacto,
+            # str(mesa) leería la sede de cada mesa; la pantalla ya es de una sede
+            'mesa': f'Mesa {p.mesa.numero}' if p.mesa_id else '',
+            'fecha_creacion': p.fecha_creacion.isoformat(),
+            'fecha_actualizacion': p.fecha_actualizacion.isoformat(),
+            'detalles': [
+                {
+                    'plato': d.variante.plato.nombre,
+                    'variante': d.variante.nombre,
+                    'cantidad': d.cantidad,
+                    'notas': d.notas,
+                }
+                for d in p.detalles.all()
+            ],
+        }
+        for p in pedidos
+    ]
+
+
+def _consulta():
+    # Con cambios: pedidos, mesas, líneas, variantes y platos (una query cada uno); si
+    # no hay, solo la primera. Sin JOIN: mesa y variante pueden estar en otra BD
+    return Pedido.objects.prefetch_related('mesa', 'detalles__variante__plato')
+
+
+def pedidos_activos(sede_id):
+    """Foto inicial de una pantalla: los pedidos que la cocina aún tiene en curso."""
+    pedidos = _consulta().using(bd_de_sede(sede_id)).activos().filter(sede_id=sede_id)
+    return _pedidos_a_dict(pedidos.order_by('fecha_creacion'))
+
+
+def _cambios_desde(desde, sedes):
+    # Una consulta por BD de pedidos (una sola si no hay shards)
+    cambios = []
+    for bd, ids in agrupar_por_bd(sedes).items():
+        pedidos = _consulta().using(bd).filter(
+            fecha_actualizacion__gte=desde - MARGEN, sede_id__in=ids
+        ).order_by('fecha_actualizacion')
+        cambios += _pedidos_a_dict(pedidos)
+    return cambios
+
+
+def evento_sse(nombre, datos):
+    """Formato de un evento SSE (text/event-stream)."""
+    return f"event: {nombre}\ndata: {json.dumps(datos)}\n\n"
+
+
+class Publicador:
+    """Bucle único de consulta y reparto a las colas de cada pantalla."""
+
+    def __init__(self):
+        self.suscriptores = {}  # {sede_id: set(asyncio.Queue)}
+        self._tarea = None
+        self._cursor = None
+        # {(sede_id, pedido_id): fecha_actualizacion ya repartida}. Con shards el id
+        # del pedido se repite entre BD, no dentro de una sede
+        self._enviados = {}
+
+    def suscribir(self, sede_id):
+        cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+        self.suscriptores.setdefault(sede_id, set()).add(cola)
+        if self._tarea is None or self._tarea.done():
+            self._cursor = timezone.now()
+            self._enviados = {}
+            self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+        return cola
+
+    def desuscribir(self, sede_id, cola):
+        colas = self.suscriptores.get(sede_id)
+        if colas is not None:
+            colas.discard(cola)
+            if not colas:
+                del self.suscriptores[sede_id]
+
+    async def _bucle(self):
+        while self.suscriptores:
+            await asyncio.sleep(INTERVALO)
+            if not self.suscriptores:
+                break
+            try:
+                await self._vuelta()
+            except Exception:
+                # Un fallo de BD no debe matar el bucle: se reintenta en la próxima vuelta
+                await sync_to_async(close_old_connections)()
+
+    async def _vuelta(self):
+        ahora = timezone.now()
+        cambios = await sync_to_async(_cambios_desde)(self._cursor, list(self.suscriptores))
+        self._cursor = ahora
+
+        limite = (ahora - MARGEN * 2).isoformat()
+        self._enviados = {k: v for k, v in self._enviados.items() if v >= limite}
+        for pedido in cambios:
+            clave = (pedido['sede_id'], pedido['id'])
+            if self._enviados.get(clave) == pedido['fecha_actualizacion']:
+                continue
+            self._enviados[clave] = pedido['fecha_actualizacion']
+            self._repartir(pedido['sede_id'], pedido)
+
+    def _repartir(self, sede_id, pedido):
+        # Cada cola recibe el dict del pedido; None pide resincronizar
+        for cola in list(self.suscriptores.get(sede_id, ())):
+            try:
+                cola.put_nowait(pedido)
+            except asyncio.QueueFull:
+                # Pantalla atascada: se vacía su cola y se le pide resincronizar
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(None)
+
+
+publicador = Publicador()
+
+
+def _versiones(pedidos):
+    """{pedido_id: fecha_actualizacion} de una foto inicial."""
+    return {p['id']: p['fecha_actualizacion'] for p in pedidos}
+
+
+async def flujo_sede(sede_id):
+    """Generador async para StreamingHttpResponse: foto inicial y luego cambios."""
+    cola = publicador.suscribir(sede_id)
+    try:
+        activos = await sync_to_async(pedidos_activos)(sede_id)
+        foto = _versiones(activos)
+        yield evento_sse('inicial', activos)
+        while True:
+            try:
+                pedido = await asyncio.wait_for(cola.get(), timeout=LATIDO)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if pedido is None:
+                activos = await sync_to_async(pedidos_activos)(sede_id)
+                foto = _versiones(activos)
+                yield evento_sse('inicial', activos)
+            elif pedido['fecha_actualizacion'] > foto.get(pedido['id'], ''):
+                yield evento_sse('pedido', pedido)
+            # Si no, la foto inicial ya trae esa versión (o una más nueva): la
+            # relectura de MARGEN no se repite ni hace retroceder la pantalla
+    finally:
+        publicador.desuscribir(sede_id, cola)
@@ -1,4 +1,7 @@
+from django.utils.functional import SimpleLazyObject
 from .carrito import Carrito
 
 def carrito_actual(request):
-    return {'carrito': Carrito(request)}
\ No newline at end of file
+    # Perezoso: la sesión solo se lee si el template realmente usa {{ carrito }}
+    # (el admin y las páginas sin carrito no tocan la sesión)
+    return {'carrito': SimpleLazyObject(lambda: Carrito(request))}
@@ -0,0 +1,157 @@
+import json
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.test import RequestFactory
+
+from core.db import bases_temporales
+from pedidos.carrito import Carrito
+
+ALMACENES = (
+    'pedidos.almacenamiento.AlmacenSesion',
+    'pedidos.almacenamiento.AlmacenCache',
+    'pedidos.almacenamiento.AlmacenCookie',
+    'pedidos.almacenamiento.AlmacenTabla',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la latencia de escritura y la contención de cada almacén del carrito "
+        "(pedidos/almacenamiento.py) sobre una BD SQLite temporal en disco, y el CPU "
+        "por click de las cuentas del carrito (céntimos vs. Decimal en texto)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clicks', type=int, default=200, help="Clicks por visitante")
+        parser.add_argument('--hilos', type=int, default=8, help="Visitantes simultáneos")
+        parser.add_argument('--lineas', type=int, default=20, help="Líneas del carrito para medir CPU")
+
+    def handle(self, *args, **options):
+        # BD en archivo (no en memoria) para medir los bloqueos reales de SQLite
+        with bases_temporales('bench_carrito'):
+            self.stdout.write(f"{'almacén':<16}{'clicks':>8}{'p50 ms':>9}{'p95 ms':>9}{'clicks/s':>10}{'bloqueos':>10}")
+            for ruta in ALMACENES:
+                self._medir(ruta, options['clicks'], options['hilos'])
+
+        self._medir_cpu(options['lineas'])
+
+    def _medir(self, ruta, clicks, hilos):
+        settings.CART_STORAGE = ruta
+        latencias = []
+        bloqueos = [0]
+        candado = threading.Lock()
+
+        def visitante(numero):
+            factory = RequestFactory()
+            sesion = SessionStore()
+            sesion.create()
+            cookies = {}
+            propias = []
+            for i in range(clicks):
+                request = factory.post('/agregar/')
+                request.session = SessionStore(session_key=sesion.session_key)
+                request.COOKIES = dict(cookies)
+                inicio = time.perf_counter()
+                try:
+                    Carrito(request).agregar(
+                        variante_id=(i % 10) + 1,
+                        precio_centimos=1250,
+                        notas=f'visitante {numero}',
+                    )
+                    # Lo que haría SessionMiddleware / CarritoCookieMiddleware al responder
+                    if request.session.modified:
+                        request.session.save()
+                    if getattr(request, '_carrito_cookie', None):
+                        cookies[settings.CART_COOKIE_NAME] = request._carrito_cookie
+                    propias.append(time.perf_counter() - inicio)
+                except OperationalError:
+                    with candado:
+                        bloqueos[0] += 1
+            with candado:
+                latencias.extend(propias)
+            connection.close()
+
+        inicio = time.perf_counter()
+        trabajadores = [threading.Thread(target=visitante, args=(n,)) for n in range(hilos)]
+        for t in trabajadores:
+            t.start()
+        for t in trabajadores:
+            t.join()
+        total = time.perf_counter() - inicio
+
+        latencias.sort()
+        p50 = statistics.median(latencias) * 1000 if latencias else 0
+        p95 = latencias[int(len(latencias) * 0.95) - 1] * 1000 if latencias else 0
+        nombre = ruta.rsplit('.', 1)[-1]
+        self.stdout.write(
+            f"{nombre:<16}{len(latencias):>8}{p50:>9.2f}{p95:>9.2f}{len(latencias) / total:>10.0f}{bloqueos[0]:>10}"
+        )
+
+    def _medir_cpu(self, lineas, repeticiones=2000):
+        """
+        CPU de un click "+1" (sumar y armar la respuesta delta) sobre un carrito
+        de 'lineas' líneas, sin almacén de por medio (sesión en memoria).
+        """
+        factory = RequestFactory()
+        sesion = SessionStore()
+        request = factory.post('/sumar/')
+        request.session = sesion
+        request.COOKIES = {}
+        settings.CART_STORAGE = 'pedidos.almacenamiento.AlmacenSesion'
+
+        carrito = Carrito(request)
+        for n in range(1, lineas + 1):
+            clave = carrito.agregar(n, 2, 1250)
+        actual = json.loads(json.dumps(sesion[settings.CART_SESSION_ID]))
+
+        # El mismo carrito en el formato anterior (solo líneas, precio en texto)
+        anterior = {
+            key: {**{k: v for k, v in item.items() if k != 'precio_centimos'}, 'precio_unitario': '12.50'}
+            for key, item in actual['items'].items()
+        }
+
+        def click_anterior(carrito):
+            # Lo que hacían Carrito + sumar_plato: parsear cada precio en cada lectura
+            item = carrito[clave]
+            precio = Decimal(item['precio_unitario'])
+            Carrito._generar_item_key(None, item['variante_id'], item['opciones'], item['notas'])
+            item['precio_unitario'] = str(precio)
+            item['cantidad'] += 1
+            subtotal = Decimal(item['precio_unitario']) * item['cantidad']
+            total = sum(Decimal(i['precio_unitario']) * i['cantidad'] for i in carrito.values())
+            items = sum(i['cantidad'] for i in carrito.values())
+            badge = sum(i['cantidad'] for i in carrito.values() if i['variante_id'] == lineas)
+            return float(subtotal), float(total), items, badge
+
+        def click_actual(datos):
+            sesion[settings.CART_SESSION_ID] = datos
+            carrito = Carrito(request)
+            item = carrito.carrito[clave]
+            carrito.agregar(lineas, 1, item['precio_centimos'], item['opciones'], item['notas'])
+            item = carrito.carrito[clave]
+            return (
+                item['precio_centimos'] * item['cantidad'] / 100,
+                carrito.get_total_centimos() / 100,
+                carrito.get_total_items(),
+                carrito.get_cantidad_de_variante(lineas),
+            )
+
+        self.stdout.write(f"\nCPU por click '+1' con {lineas} líneas ({repeticiones} repeticiones):")
+        for nombre, funcion, guardado in (
+            ('decimal texto', click_anterior, anterior),
+            ('céntimos', click_actual, actual),
+        ):
+            # Deserializar no cambia entre formatos: las copias se preparan fuera del cronómetro
+            copias = [json.loads(json.dumps(guardado)) for _ in range(repeticiones)]
+            inicio = time.process_time()
+            for copia in copias:
+                funcion(copia)
+            micro = (time.process_time() - inicio) / repeticiones * 1_000_000
+            self.stdout.write(f"{nombre:<16}{micro:>9.1f} µs")
@@ -0,0 +1,124 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections, OperationalError
+
+from catalogo.models import Categoria
+from core.db import bases_temporales
+
+# (nombre, SQLITE_PRAGMAS, CONN_MAX_AGE, OPTIONS): lo que cambia entre perfiles
+PERFILES = (
+    ('desarrollo', {}, 0, {}),
+    ('produccion', None, 600, {'transaction_mode': 'IMMEDIATE'}),  # None = los de settings
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Escritores (sesiones con carrito) y lectores (menú y sesión) en paralelo sobre "
+        "SQLite en disco, con el perfil de desarrollo y con el de producción "
+        "(WAL, PRAGMA, conexiones persistentes; ver core/db.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segundos', type=float, default=5)
+        parser.add_argument('--escritores', type=int, default=4)
+        parser.add_argument('--lectores', type=int, default=8)
+
+    def handle(self, *args, **options):
+        base = connections.settings['default']
+        original = (settings.SQLITE_PRAGMAS, base['CONN_MAX_AGE'], base['OPTIONS'])
+
+        self.stdout.write(
+            f"{'perfil':<12}{'journal':>9}{'escrit/s':>10}{'lect/s':>10}{'p95 escr ms':>13}{'p95 lect ms':>13}{'bloqueos':>10}"
+        )
+        try:
+            for nombre, pragmas, edad, opciones in PERFILES:
+                settings.SQLITE_PRAGMAS = settings.SQLITE_PRAGMAS_PRODUCCION if pragmas is None else pragmas
+                base['CONN_MAX_AGE'] = edad
+                base['OPTIONS'] = opciones
+                # BD nueva por perfil: el modo WAL queda grabado en el archivo
+                with bases_temporales(f'bench_sqlite_{nombre}'):
+                    self._medir(nombre, options)
+        finally:
+            settings.SQLITE_PRAGMAS, base['CONN_MAX_AGE'], base['OPTIONS'] = original
+
+    def _medir(self, nombre, options):
+        claves = []
+        for _ in range(options['escritores'] * 4):
+            sesion = SessionStore()
+            sesion['carrito'] = {'items': {}}
+            sesion.create()
+            claves.append(sesion.session_key)
+        # Lo que de verdad quedó en la conexión (confirma que corrió el hook de core/db.py)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            modo = cursor.fetchone()[0]
+
+        fin = time.perf_counter() + options['segundos']
+        escrituras, lecturas, bloqueos = [], [], [0]
+        candado = threading.Lock()
+
+        def pedido(operacion, tiempos):
+            # Un "request": la operación y luego lo que hace request_finished con la conexión
+            inicio = time.perf_counter()
+            try:
+                operacion()
+                tiempos.append(time.perf_counter() - inicio)
+            except OperationalError:
+                with candado:
+                    bloqueos[0] += 1
+            finally:
+                close_old_connections()
+
+        def escritor(numero):
+            propios = []
+            i = 0
+            while time.perf_counter() < fin:
+                clave = claves[(numero + i * options['escritores']) % len(claves)]
+
+                def escribir():
+                    sesion = SessionStore(session_key=clave)
+                    sesion['carrito'] = {'items': {str(i): {'variante_id': i % 10, 'cantidad': 1}}}
+                    sesion.save()
+                pedido(escribir, propios)
+                i += 1
+            with candado:
+                escrituras.extend(propios)
+            connection.close()
+
+        def lector(numero):
+            propios = []
+            i = 0
+            while time.perf_counter() < fin:
+                clave = claves[(numero + i) % len(claves)]
+
+                def leer():
+                    SessionStore(session_key=clave).load()
+                    list(Categoria.objects.filter(activo=True).order_by('orden')[:20])
+                pedido(leer, propios)
+                i += 1
+            with candado:
+                lecturas.extend(propios)
+            connection.close()
+
+        hilos = [threading.Thread(target=escritor, args=(n,)) for n in range(options['escritores'])]
+        hilos += [threading.Thread(target=lector, args=(n,)) for n in range(options['lectores'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+
+        def p95(tiempos):
+            return statistics.quantiles(tiempos, n=20)[-1] * 1000 if len(tiempos) > 1 else 0
+
+        self.stdout.write(
+            f"{nombre:<12}{modo:>9}{len(escrituras) / total:>10.0f}{len(lecturas) / total:>10.0f}"
+            f"{p95(escrituras):>13.2f}{p95(lecturas):>13.2f}{bloqueos[0]:>10}"
+        )
@@ -0,0 +1,166 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from catalogo.models import Categoria, Plato, Variante
+from core.db import bases_temporales
+from core.models import Marca, Sede
+from pedidos.models import Pedido
+from pedidos.shards import bd_de_sede, bds_pedidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga datos sintéticos (por defecto 1M de pedidos) en una BD SQLite temporal y "
+        "revisa con EXPLAIN QUERY PLAN que las consultas calientes usen sus índices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=1_000_000, help="Pedidos sintéticos")
+        parser.add_argument('--sedes', type=int, default=5)
+        parser.add_argument('--marcas', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with bases_temporales('explain_indices'):
+            with transaction.atomic():
+                self._poblar(options['pedidos'], options['sedes'], options['marcas'])
+            for alias in {'default', *bds_pedidos()}:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            fallas = self._revisar()
+
+        if fallas:
+            raise CommandError(f"{fallas} consulta(s) no usan el índice esperado.")
+
+    def _poblar(self, total_pedidos, total_sedes, total_marcas):
+        inicio = time.perf_counter()
+        sedes = Sede.objects.bulk_create(
+            Sede(nombre=f'Sede {n}', direccion='-', telefono='-') for n in range(total_sedes)
+        )
+        marcas = Marca.objects.bulk_create(
+            Marca(nombre=f'Marca {n}', slug=f'marca-{n}') for n in range(total_marcas)
+        )
+        categorias = Categoria.objects.bulk_create(
+            Categoria(marca=marca, nombre=f'Cat {n}', orden=n, activo=n % 5 != 0)
+            for marca in marcas for n in range(12)
+        )
+        platos = Plato.objects.bulk_create(
+            Plato(marca_id=categoria.marca_id, categoria=categoria, nombre=f'Plato {n}', orden=n % 7)
+            for categoria in categorias for n in range(25)
+        )
+        Variante.objects.bulk_create(
+            Variante(plato=plato, nombre=f'V{n}', precio=Decimal('12.50'), activo=n != 2)
+            for plato in platos for n in range(3)
+        )
+
+        # Pedidos por SQL directo: con bulk_create 1M de instancias no entran en memoria
+        # Histórico realista: casi todo finalizado, ~1% en curso
+        tabla = Pedido._meta.db_table
+        columnas = (
+            'sede_id', 'fecha_creacion', 'fecha_actualizacion', 'nombre_contacto',
+            'telefono_contacto', 'tipo_servicio', 'direccion_entrega', 'estado', 'total', 'metodo_pago',
+        )
+        sql = (
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) "
+            f"VALUES ({', '.join(['%s'] * len(columnas))})"
+        )
+        ahora = timezone.now()
+        azar = random.Random(21)
+        ids_sedes = [sede.id for sede in sedes]
+        finales = ['ENTREGADO'] * 9 + ['CANCELADO']
+        activos = ['PENDIENTE', 'CONFIRMADO', 'LISTO']
+
+        def filas(cantidad):
+            for _ in range(cantidad):
+                fecha = ahora - timedelta(minutes=azar.randrange(365 * 24 * 60))
+                estado = azar.choice(activos) if azar.random() < 0.01 else azar.choice(finales)
+                yield (
+                    azar.choice(ids_sedes), fecha, fecha, 'Invitado', '', 'RECOJO', '',
+                    estado, '25.00', 'EFECTIVO',
+                )
+
+        # Cada pedido va a la BD de su sede (DB_SEPARADAS / PEDIDOS_SHARDS)
+        restantes = total_pedidos
+        while restantes:
+            lote = min(restantes, 50_000)
+            por_bd = {}
+            for fila in filas(lote):
+                por_bd.setdefault(bd_de_sede(fila[0]), []).append(fila)
+            for alias, grupo in por_bd.items():
+                with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                    cursor.executemany(sql, grupo)
+            restantes -= lote
+
+        self.stdout.write(
+            f"Datos: {total_pedidos} pedidos, {len(categorias)} categorías, {len(platos)} platos "
+            f"({time.perf_counter() - inicio:.1f} s)\n"
+        )
+
+    def _consultas(self):
+        """(descripción, queryset, índices aceptados). Son las consultas que el sitio repite."""
+        sede_id = Sede.objects.order_by('id').values_list('id', flat=True).first()
+        marca = Marca.objects.order_by('id').first()
+        categoria_ids = list(
+            Categoria.objects.filter(marca=marca, activo=True).values_list('id', flat=True)
+        )
+        pedidos = Pedido.objects.using(bd_de_sede(sede_id))
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        return [
+            (
+                'menú: categorías de la marca',
+                Categoria.objects.filter(marca=marca, activo=True).order_by('orden'),
+                ('categoria_marca_activo_orden', 'categoria_activas_orden'),
+            ),
+            (
+                # Lo que lanza el prefetch 'platos' de obtener_categorias_menu()
+                'menú: platos de las categorías',
+                Plato.objects.filter(categoria__in=categoria_ids),
+                ('plato_categoria_orden',),
+            ),
+            (
+                'modales: variantes activas',
+                Variante.objects.filter(plato__categoria_id=categoria_ids[0], activo=True),
+                ('variante_activas_plato',),
+            ),
+            (
+                'admin: sede + estado + fecha',
+                pedidos.filter(
+                    sede_id=sede_id, estado='ENTREGADO', fecha_creacion__gte=hace_una_semana
+                ),
+                ('pedido_sede_estado_fecha',),
+            ),
+            (
+                'cocina: pedidos activos',
+                pedidos.activos().filter(sede_id=sede_id).order_by('fecha_creacion'),
+                ('pedido_activos_sede_fecha',),
+            ),
+            (
+                'cocina: cambios recientes',
+                pedidos.filter(fecha_actualizacion__gte=timezone.now() - timedelta(seconds=5)),
+                ('fecha_actualizacion',),
+            ),
+        ]
+
+    def _revisar(self):
+        fallas = 0
+        self.stdout.write(f"{'consulta':<34}{'filas':>8}{'ms':>9}  índice")
+        for descripcion, queryset, indices in self._consultas():
+            plan = queryset.explain()
+            usado = next((nombre for nombre in indices if nombre in plan), None)
+
+            inicio = time.perf_counter()
+            filas = len(list(queryset))
+            milis = (time.perf_counter() - inicio) * 1000
+
+            if usado:
+                self.stdout.write(f"{descripcion:<34}{filas:>8}{milis:>9.2f}  {usado}")
+            else:
+                fallas += 1
+                self.stdout.write(self.style.ERROR(f"{descripcion:<34}{filas:>8}{milis:>9.2f}  NINGUNO"))
+                self.stdout.write(f"    esperado: {', '.join(indices)}\n    plan: {plan}")
+        return fallas
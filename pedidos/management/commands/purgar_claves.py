@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pedidos.checkout import purgar_claves
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las claves de idempotencia del checkout con más de "
+        "IDEMPOTENCIA_VIGENCIA segundos (en todas las BD de pedidos)."
+    )
+
+    def handle(self, *args, **options):
+        borradas = purgar_claves()
+        self.stdout.write(
+            f"{borradas} clave(s) vencida(s) borrada(s) (vigencia: {settings.IDEMPOTENCIA_VIGENCIA} s)."
+        )
@@ -0,0 +1,32 @@
+from django.conf import settings
+
+
+class CarritoCookieMiddleware:
+    """
+    Escribe (o borra) la cookie del carrito cuando se usa AlmacenCookie.
+    Con cualquier otro almacén no hace nada.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        valor = getattr(request, '_carrito_cookie', None)
+        if valor is None:
+            return response
+
+        nombre = getattr(settings, 'CART_COOKIE_NAME', 'carrito')
+        if valor:
+            response.set_cookie(
+                nombre,
+                valor,
+                max_age=getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        else:
+            response.delete_cookie(nombre, samesite='Lax')
+        return response
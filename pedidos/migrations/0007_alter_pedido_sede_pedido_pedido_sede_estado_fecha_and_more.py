@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_rename_color_primario_marca_color_coorporativo_and_more'),
+        ('pedidos', '0006_pedido_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='sede',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to='core.sede'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['sede', 'estado', 'fecha_creacion'], name='pedido_sede_estado_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado__in', ('ENTREGADO', 'CANCELADO')), _negated=True), fields=['sede', 'fecha_creacion'], name='pedido_activos_sede_fecha'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0011_alter_categoria_marca_alter_plato_categoria_and_more'),
+        ('core', '0002_rename_color_primario_marca_color_coorporativo_and_more'),
+        ('pedidos', '0007_alter_pedido_sede_pedido_pedido_sede_estado_fecha_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detallepedido',
+            name='variante',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='catalogo.variante'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='cliente',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='core.cliente'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='mesa',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='core.mesa'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='sede',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='pedidos', to='core.sede'),
+        ),
+    ]
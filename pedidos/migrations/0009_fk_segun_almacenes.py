@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+import pedidos.models
+
+
+# 0008 quitó las FOREIGN KEY hacia el catálogo/core con DO_NOTHING. Siguen sin
+# restricción en SQL (el mismo esquema con una BD o con almacenes separados) y
+# cada FK recupera su regla de borrado, aplicada por el ORM (ver
+# pedidos.models._fk_externa).
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0008_alter_detallepedido_variante_alter_pedido_cliente_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detallepedido',
+            name='variante',
+            field=models.ForeignKey(db_constraint=False, on_delete=pedidos.models.proteger_entre_bases, to='catalogo.variante'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='cliente',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=pedidos.models.soltar_entre_bases, to='core.cliente'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='mesa',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=pedidos.models.soltar_entre_bases, to='core.mesa'),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='sede',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=pedidos.models.cascada_entre_bases, related_name='pedidos', to='core.sede'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0009_fk_segun_almacenes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claveidempotencia',
+            index=models.Index(fields=['creado'], name='clave_idempotencia_creado'),
+        ),
+    ]
@@ -1,25 +1,133 @@
-from django.db import models
+import re
+from django.conf import settings
+from django.db import models, router
+from django.db.models import ProtectedError
 from django.core.validators import MinValueValidator
 from core.models import Sede, Mesa, Cliente, PerfilEmpleado
 from catalogo.models import Variante # El producto con precio
+from core.dinero import a_decimal
+
+# Estados en los que el pedido ya salió de la cocina
+ESTADOS_FINALES = ('ENTREGADO', 'CANCELADO')
+
+
+class FueraDeLiterales(models.Lookup):
+    """
+    NOT (campo IN ('A', 'B')) con los valores escritos en el SQL, no como parámetros.
+    El índice parcial pedido_activos_sede_fecha solo se usa si el WHERE repite
+    su condición con los MISMOS literales: con parámetros (lo que genera un
+    exclude(estado__in=...) normal) SQLite no puede probar que encajan y lo ignora.
+    Solo para constantes del código, nunca para datos del usuario.
+    """
+    lookup_name = 'fuera_de_literales'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        # NUNCA debe llegar aquí un valor del usuario: va sin escapar dentro del SQL.
+        # Por eso solo se aceptan palabras simples (ENTREGADO, CANCELADO...): sin
+        # comillas ni '%' que rompan el literal o los parámetros del resto de la query
+        for valor in self.rhs:
+            if not isinstance(valor, str) or not re.fullmatch(r'[A-Za-z0-9_]+', valor):
+                raise ValueError(f'FueraDeLiterales solo admite identificadores simples: {valor!r}')
+        literales = ', '.join("'%s'" % valor for valor in self.rhs)
+        return f'NOT ({lhs} IN ({literales}))', params
+
+
+# --- RELACIONES CON OTRA BASE DE DATOS ---
+# Con los almacenes separados (settings.DB_SEPARADAS, core/routers.py) Sede, Mesa,
+# Cliente y Variante viven en otra BD que los pedidos: no puede haber FOREIGN KEY
+# en SQL y el on_delete del ORM buscaría los pedidos en la BD equivocada. Para que
+# el esquema (y las migraciones) sea el mismo en toda instalación, esas FK van
+# siempre sin restricción y sus reglas las aplica el ORM:
+# - PROTECT (Variante): proteger_entre_bases, dentro del Collector, así que el
+#   admin sigue mostrando su pantalla de "objetos protegidos".
+# - CASCADE / SET_NULL (Sede, Mesa, Cliente): con una BD, el Collector de siempre;
+#   con almacenes separados, pedidos/signals.py cuando el borrado ya confirmó.
+# Al Collector no se le deja evaluar sub_objs por su cuenta (lazy_sub_objs): con
+# almacenes separados la tabla no está en su BD.
+
+def proteger_entre_bases(collector, field, sub_objs, using):
+    """PROTECT para una FK sin restricción: busca las filas en cada BD de pedidos."""
+    from .shards import bds_pedidos
+    for bd in bds_pedidos():
+        # Sin select_related: el admin lo pide y sería un JOIN hacia otra BD
+        protegidos = list(sub_objs.using(bd).select_related(None)[:10])
+        if protegidos:
+            raise ProtectedError(
+                f'Ya figura en pedidos ({bd}): desactívalo en lugar de borrarlo.', protegidos
+            )
+
+
+def cascada_entre_bases(collector, field, sub_objs, using):
+    """CASCADE para una FK sin restricción (con almacenes separados: pedidos/signals.py)."""
+    if not settings.DB_SEPARADAS and sub_objs:
+        models.CASCADE(collector, field, sub_objs, using)
+
+
+def soltar_entre_bases(collector, field, sub_objs, using):
+    """SET_NULL para una FK sin restricción (con almacenes separados: pedidos/signals.py)."""
+    if not settings.DB_SEPARADAS and sub_objs:
+        models.SET_NULL(collector, field, sub_objs, using)
+
+
+for _regla in (proteger_entre_bases, cascada_entre_bases, soltar_entre_bases):
+    _regla.lazy_sub_objs = True
+
+_REGLAS_ENTRE_BASES = {
+    models.PROTECT: proteger_entre_bases,
+    models.CASCADE: cascada_entre_bases,
+    models.SET_NULL: soltar_entre_bases,
+}
+
+
+def _fk_externa(modelo, on_delete, **opciones):
+    """FK hacia el catálogo/core: sin restricción en SQL, con su regla aplicada por el ORM."""
+    return models.ForeignKey(
+        modelo, on_delete=_REGLAS_ENTRE_BASES[on_delete], db_constraint=False, **opciones
+    )
+
+
+class EnShardQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """
+        Sin .using(), la BD sale de la instancia nueva (su sede o su pedido).
+        El create() de Django elige la BD antes de tener la instancia y con
+        shards no sabría a cuál escribir (core/routers.py).
+        """
+        if self._db is None:
+            return self.using(router.db_for_write(self.model, instance=self.model(**kwargs))).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class PedidoQuerySet(EnShardQuerySet):
+    def activos(self):
+        """Pedidos en curso (no entregados ni anulados)."""
+        return self.filter(FueraDeLiterales(models.F('estado'), ESTADOS_FINALES))
+
+
 # Create your models here.
 class Pedido(models.Model):
     """
     EL TICKET DE VENTA (CABECERA)
     """
     # 1. Contexto
-    sede = models.ForeignKey(Sede, on_delete=models.CASCADE, related_name='pedidos')
+    # Sede, Cliente y Mesa pueden vivir en otra BD: ver _fk_externa
+    # Sin índice propio: lo cubren los índices compuestos que empiezan por sede (Meta)
+    sede = _fk_externa(Sede, models.CASCADE, related_name='pedidos', db_index=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Cambia con cada save() o cambio de líneas: la pantalla de cocina lee "lo nuevo desde X"
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
     # 2. Cliente (Híbrido)
     # Si es cliente fiel, usamos este campo:
-    cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True)
+    cliente = _fk_externa(Cliente, models.SET_NULL, null=True, blank=True)
     # Si es invitado (o para el nombre en el ticket), usamos estos:
     nombre_contacto = models.CharField(max_length=100, default="Invitado")
     telefono_contacto = models.CharField(max_length=20, blank=True)
     # 3. Datos de Entrega
     TIPOS = [('MESA', 'Mesa'), ('DELIVERY', 'Delivery'), ('RECOJO', 'Para Llevar')]
     tipo_servicio = models.CharField(max_length=20, choices=TIPOS, default='MESA')
-    mesa = models.ForeignKey(Mesa, on_delete=models.SET_NULL, null=True, blank=True)
+    mesa = _fk_externa(Mesa, models.SET_NULL, null=True, blank=True)
     direccion_entrega = models.CharField(max_length=200, blank=True)
     # 4. Dinero y Estado
     ESTADOS = [
@@ -32,6 +140,20 @@ class Pedido(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     metodo_pago = models.CharField(max_length=50, default='EFECTIVO')
+
+    objects = PedidoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Admin y dashboard: filtros por sede + estado + fecha
+            models.Index(fields=['sede', 'estado', 'fecha_creacion'], name='pedido_sede_estado_fecha'),
+            # Cocina: solo los pedidos en curso de una sede, por llegada. Es una fracción
+            # pequeña de la tabla (los finalizados no entran al índice)
+            models.Index(
+                fields=['sede', 'fecha_creacion'], name='pedido_activos_sede_fecha',
+                condition=~models.Q(estado__in=ESTADOS_FINALES),
+            ),
+        ]
     def __str__(self):
         return f"Pedido #{self.id} - {self.nombre_contacto}"
 
@@ -40,16 +162,73 @@ class DetallePedido(models.Model):
     LOS PLATOS DEL PEDIDO (ITEMS)
     """
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='detalles')
-    variante = models.ForeignKey(Variante, on_delete=models.PROTECT) # El plato y precio específico
+    variante = _fk_externa(Variante, models.PROTECT) # El plato y precio específico
     cantidad = models.PositiveIntegerField(default=1)
     # Guardamos el precio del momento (snapshot) por si sube mañana
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     notas = models.CharField(max_length=200, blank=True, help_text="Ej: Sin picante")
+
+    objects = EnShardQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         # Auto-calculo del subtotal de esta línea
         self.subtotal = self.precio_unitario * self.cantidad
         super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores con los que se leyó la línea: las señales (pedidos/signals.py)
+        # aplican al total del pedido solo la diferencia
+        instancia._subtotal_original = instancia.__dict__.get('subtotal')
+        instancia._pedido_original = instancia.__dict__.get('pedido_id')
+        return instancia
+    @classmethod
+    def desde_centimos(cls, pedido, variante_id, cantidad, precio_centimos, notas=''):
+        """Snapshot de una línea del carrito: el precio llega en céntimos y se guarda en soles."""
+        return cls(
+            pedido=pedido,
+            variante_id=variante_id,
+            cantidad=cantidad,
+            precio_unitario=a_decimal(precio_centimos),
+            subtotal=a_decimal(precio_centimos * cantidad),
+            notas=notas,
+        )
     def __str__(self):
         return f"{self.cantidad}x {self.variante.plato.nombre}"
-    
+
+
+class CarritoGuardado(models.Model):
+    """
+    Carrito fuera de la sesión (settings.CART_STORAGE = AlmacenTabla).
+    Una fila chica por visitante: cada click es un UPDATE de esta fila.
+    """
+    token = models.CharField(max_length=32, unique=True)
+    datos = models.JSONField(default=dict)
+    actualizado = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"Carrito {self.token}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Clave que manda el cliente con cada "Pagar". Si la misma clave llega otra
+    vez (doble tap, reintento del proxy) se devuelve el pedido ya creado en
+    lugar de crear otro. El índice único resuelve las carreras sin bloqueos.
+    """
+    clave = models.CharField(max_length=64, unique=True)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, null=True, related_name='claves_idempotencia')
+    # Resumen de los datos enviados: la misma clave con otros datos se rechaza
+    huella = models.CharField(max_length=64)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    objects = EnShardQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # purgar_claves: DELETE de las vencidas por fecha
+            models.Index(fields=['creado'], name='clave_idempotencia_creado'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} -> Pedido #{self.pedido_id}"
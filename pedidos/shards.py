@@ -0,0 +1,53 @@
+# pedidos/shards.py
+"""
+En qué base de datos están los pedidos de una sede y cómo consultar todas.
+
+Sin shards (lo normal) hay una sola BD de pedidos y todo esto es trivial. Con
+settings.PEDIDOS_SHARDS (core/routers.py) cada sede escribe en su propio
+archivo: una ráfaga de pedidos en una sede no hace esperar a las demás.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, router
+
+from core.routers import shards_pedidos
+from .models import Pedido
+
+
+def bd_de_sede(sede_id):
+    """Alias de la BD con los pedidos de la sede (respeta el router configurado)."""
+    return router.db_for_write(Pedido, sede_id=sede_id)
+
+
+def bds_pedidos():
+    """Todas las BD con pedidos: los shards, o la única que haya."""
+    return shards_pedidos() or [router.db_for_write(Pedido)]
+
+
+def agrupar_por_bd(sede_ids):
+    """{alias: [sede_id, ...]}: una consulta por BD en lugar de una por sede."""
+    grupos = {}
+    for sede_id in sede_ids:
+        grupos.setdefault(bd_de_sede(sede_id), []).append(sede_id)
+    return grupos
+
+
+def en_cada_bd(consulta):
+    """
+    Ejecuta consulta(alias) en cada BD de pedidos y devuelve {alias: resultado}.
+    Con varios shards van en paralelo (un hilo por shard: cada archivo tiene su
+    propio candado), así el total tarda lo que el shard más lento.
+    """
+    bds = bds_pedidos()
+    if len(bds) == 1:
+        return {bds[0]: consulta(bds[0])}
+
+    def correr(alias):
+        try:
+            return consulta(alias)
+        finally:
+            connections.close_all()  # conexiones de este hilo
+
+    with ThreadPoolExecutor(max_workers=len(bds)) as hilos:
+        return dict(zip(bds, hilos.map(correr, bds)))
@@ -1,12 +1,173 @@
+import threading
+from contextlib import contextmanager
+from functools import partial
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Sum
-from .models import DetallePedido
-
-@receiver([post_save, post_delete], sender=DetallePedido)
-def actualizar_total_pedido(sender, instance, **kwargs):
-    pedido = instance.pedido
-    # Suma todos los subtotales de este pedido
-    resultado = pedido.detalles.aggregate(total_calculado=Sum('subtotal'))
-    pedido.total = resultado['total_calculado'] or 0.00
-    pedido.save()
\ No newline at end of file
+from django.utils import timezone
+from core.models import Sede, Mesa, Cliente
+from .carrito import CLAVE_SEDE_POR_DEFECTO
+from .models import Pedido, DetallePedido
+from .shards import bds_pedidos
+
+# --- TOTAL DEL PEDIDO ---
+# Cada cambio de una línea suma/resta SU diferencia al total con un UPDATE
+# ... SET total = total + delta (F), sin recorrer las demás líneas.
+# Dentro de totales_diferidos() ni eso: se anotan los pedidos tocados y cada
+# uno se recalcula UNA vez cuando la transacción confirma.
+# Los UPDATE también tocan fecha_actualizacion (.update() no aplica auto_now):
+# así la pantalla de cocina (pedidos/cocina.py) ve los cambios de líneas.
+
+_estado = threading.local()
+
+
+def _pedidos_diferidos():
+    """{bd: set de pedidos} pendientes de recalcular, o None si no estamos difiriendo."""
+    return getattr(_estado, 'pedidos', None)
+
+
+def recalcular_totales(pedido_ids, using=None):
+    """Recalcula el total de varios pedidos con un solo UPDATE (Sum por subconsulta)."""
+    if not pedido_ids:
+        return
+    suma = (
+        DetallePedido.objects.using(using).filter(pedido=OuterRef('pk'))
+        .values('pedido')
+        .annotate(total=Sum('subtotal'))
+        .values('total')
+    )
+    Pedido.objects.using(using).filter(pk__in=pedido_ids).update(
+        total=Coalesce(Subquery(suma), Value(Decimal('0.00'))),
+        fecha_actualizacion=timezone.now(),
+    )
+
+
+@contextmanager
+def totales_diferidos():
+    """
+    Difiere el mantenimiento de totales: las líneas que se guarden o borren
+    dentro del bloque marcan su pedido, y al confirmar la transacción cada
+    pedido marcado se recalcula una sola vez. Se puede anidar.
+    """
+    if _pedidos_diferidos() is not None:
+        yield
+        return
+
+    _estado.pedidos = {}
+    try:
+        yield
+    finally:
+        pedidos = _estado.pedidos
+        _estado.pedidos = None
+
+    # Cada BD de pedidos (shard) confirma por su cuenta
+    for bd, ids in pedidos.items():
+        transaction.on_commit(partial(recalcular_totales, ids, bd), using=bd)
+
+
+def _aplicar_delta(pedido_id, delta, instance, using):
+    if not delta:
+        return
+    Pedido.objects.using(using).filter(pk=pedido_id).update(
+        total=F('total') + delta, fecha_actualizacion=timezone.now()
+    )
+    # El pedido que ya está en memoria queda al día (un save() posterior no pisa el total)
+    if DetallePedido.pedido.is_cached(instance) and instance.pedido.pk == pedido_id:
+        instance.pedido.total = Decimal(str(instance.pedido.total)) + delta
+
+
+@receiver(post_save, sender=DetallePedido)
+def actualizar_total_pedido(sender, instance, created, using, **kwargs):
+    diferidos = _pedidos_diferidos()
+    original = None if created else getattr(instance, '_subtotal_original', None)
+    pedido_original = getattr(instance, '_pedido_original', None)
+
+    if diferidos is not None:
+        diferidos.setdefault(using, set()).update(p for p in (instance.pedido_id, pedido_original) if p)
+    elif not created and original is None:
+        # No sabemos con qué subtotal se leyó la línea: recalculamos este pedido
+        recalcular_totales([instance.pedido_id], using)
+    elif pedido_original and pedido_original != instance.pedido_id:
+        # La línea cambió de pedido: sale completa de uno y entra completa al otro
+        Pedido.objects.using(using).filter(pk=pedido_original).update(
+            total=F('total') - original, fecha_actualizacion=timezone.now()
+        )
+        _aplicar_delta(instance.pedido_id, instance.subtotal, instance, using)
+    else:
+        _aplicar_delta(instance.pedido_id, instance.subtotal - (original or 0), instance, using)
+
+    instance._subtotal_original = instance.subtotal
+    instance._pedido_original = instance.pedido_id
+
+
+@receiver(post_delete, sender=DetallePedido)
+def descontar_total_pedido(sender, instance, using, **kwargs):
+    diferidos = _pedidos_diferidos()
+    if diferidos is not None:
+        diferidos.setdefault(using, set()).add(instance.pedido_id)
+        return
+    # Se resta lo que la línea aportaba según la BD (si se leyó de ahí)
+    aporte = getattr(instance, '_subtotal_original', None)
+    if aporte is None:
+        aporte = instance.subtotal
+    _aplicar_delta(instance.pedido_id, -aporte, instance, using)
+
+
+# --- SEDE POR DEFECTO DEL VISITANTE ---
+
+@receiver([post_save, post_delete], sender=Sede)
+def invalidar_sede_por_defecto(sender, using, **kwargs):
+    # Un cambio de semáforo puede cambiar la sede de quien aún no eligió. Se borra
+    # ya y al confirmar: si alguien la recalculó en medio, no queda la vieja
+    cache.delete(CLAVE_SEDE_POR_DEFECTO)
+    transaction.on_commit(partial(cache.delete, CLAVE_SEDE_POR_DEFECTO), using=using)
+
+
+# --- BORRADOS DESDE OTRA BASE DE DATOS ---
+# Solo con almacenes separados (settings.DB_SEPARADAS): ahí las reglas de las FK
+# desde pedidos hacia Sede, Mesa y Cliente no hacen nada en el Collector
+# (pedidos/models.py) y aquí se aplica el CASCADE / SET_NULL de siempre. Entre dos BD no hay una transacción
+# común: se hace cuando el borrado ya confirmó, así un borrado que se revierte
+# no se lleva pedidos. Si esto fallara quedarían filas huérfanas, nunca pedidos
+# borrados de más. La Variante (PROTECT) se resuelve dentro del Collector.
+
+def _en_cada_bd_pedidos(accion):
+    for bd in bds_pedidos():
+        with transaction.atomic(using=bd):
+            accion(Pedido.objects.using(bd))
+
+
+def borrar_pedidos_de_sede(sender, instance, using, **kwargs):
+    sede_id = instance.pk
+    transaction.on_commit(
+        lambda: _en_cada_bd_pedidos(lambda pedidos: pedidos.filter(sede_id=sede_id).delete()),
+        using=using,
+    )
+
+
+def soltar_mesa_de_pedidos(sender, instance, using, **kwargs):
+    mesa_id = instance.pk
+    transaction.on_commit(
+        lambda: _en_cada_bd_pedidos(lambda pedidos: pedidos.filter(mesa_id=mesa_id).update(mesa=None)),
+        using=using,
+    )
+
+
+def soltar_cliente_de_pedidos(sender, instance, using, **kwargs):
+    # Un cliente puede haber pedido en cualquier sede
+    cliente_id = instance.pk
+    transaction.on_commit(
+        lambda: _en_cada_bd_pedidos(lambda pedidos: pedidos.filter(cliente_id=cliente_id).update(cliente=None)),
+        using=using,
+    )
+
+
+if settings.DB_SEPARADAS:
+    post_delete.connect(borrar_pedidos_de_sede, sender=Sede)
+    post_delete.connect(soltar_mesa_de_pedidos, sender=Mesa)
+    post_delete.connect(soltar_cliente_de_pedidos, sender=Cliente)
@@ -1,3 +1,572 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connections
+from django.db.models import F, ProtectedError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalogo.models import Categoria, GrupoOpciones, Opcion, Plato, Variante
+from core.models import Marca, Mesa, Sede
+from . import checkout
+from .almacenamiento import AlmacenCookie
+from .carrito import FORMATO_CARRITO, SESION_SEDE, Carrito, sede_por_defecto, sede_visitante
+from .checkout import PedidoInvalido
+from .models import CarritoGuardado, ClaveIdempotencia, DetallePedido, FueraDeLiterales, Pedido
+from .shards import bd_de_sede
+from .signals import totales_diferidos
+
+
+# Con DB_SEPARADAS los pedidos viven en otras BD (core/routers.py). La de solo
+# lectura es un espejo de 'default' en los tests: no se declara aparte
+BASES = set(settings.DATABASES) - {'catalogo_lectura'}
+
+
+def crear_catalogo():
+    """Una marca con un plato y una variante de S/ 10.00."""
+    marca = Marca.objects.create(nombre='Terramar', slug='terramar')
+    categoria = Categoria.objects.create(marca=marca, nombre='Fondos', orden=1)
+    plato = Plato.objects.create(marca=marca, categoria=categoria, nombre='Ceviche')
+    variante = Variante.objects.create(plato=plato, nombre='Personal', precio=Decimal('10.00'))
+    return marca, plato, variante
+
+
+def crear_pedido(sede, variante, cantidad=1, **datos):
+    bd = bd_de_sede(sede.id)
+    pedido = Pedido.objects.using(bd).create(sede=sede, **datos)
+    DetallePedido.objects.using(bd).create(
+        pedido=pedido, variante=variante, cantidad=cantidad, precio_unitario=variante.precio
+    )
+    return pedido
+
+
+def nuevo_request(session=None, cookies=None):
+    request = RequestFactory().post('/')
+    request.session = session if session is not None else SessionStore()
+    request.COOKIES = cookies or {}
+    return request
+
+
+# --- ALMACENES DEL CARRITO ---
+
+class AlmacenesTests(TestCase):
+    databases = BASES
+
+    def ida_y_vuelta(self):
+        """Agrega en una petición y lee el carrito desde la siguiente."""
+        request = nuevo_request()
+        Carrito(request).agregar(1, 2, 1050)
+        cookie = getattr(request, '_carrito_cookie', None)
+        siguiente = nuevo_request(request.session, {'carrito': cookie} if cookie else None)
+        return request, Carrito(siguiente)
+
+    def test_cada_almacen_devuelve_lo_guardado(self):
+        for almacen in ('AlmacenSesion', 'AlmacenCache', 'AlmacenCookie', 'AlmacenTabla'):
+            with self.subTest(almacen=almacen), \
+                    override_settings(CART_STORAGE=f'pedidos.almacenamiento.{almacen}'):
+                _, carrito = self.ida_y_vuelta()
+                self.assertEqual(len(carrito), 2)
+                self.assertEqual(carrito.get_total_centimos(), 2100)
+
+    def test_almacenes_externos_no_reescriben_la_sesion(self):
+        for almacen in ('AlmacenCache', 'AlmacenTabla'):
+            with self.subTest(almacen=almacen), \
+                    override_settings(CART_STORAGE=f'pedidos.almacenamiento.{almacen}'):
+                request, _ = self.ida_y_vuelta()
+                # El token se guardó al crear el carrito; los clicks siguientes no tocan la sesión
+                request.session.modified = False
+                Carrito(request).agregar(1, 1)
+                self.assertFalse(request.session.modified)
+
+    @override_settings(CART_STORAGE='pedidos.almacenamiento.AlmacenTabla')
+    def test_tabla_actualiza_su_fila(self):
+        request, _ = self.ida_y_vuelta()
+        Carrito(request).agregar(1, 1)
+        self.assertEqual(CarritoGuardado.objects.count(), 1)
+        Carrito(request).limpiar()
+        self.assertFalse(CarritoGuardado.objects.exists())
+
+    @override_settings(CART_STORAGE='pedidos.almacenamiento.AlmacenCookie')
+    def test_cookie_alterada_se_descarta(self):
+        request, _ = self.ida_y_vuelta()
+        alterada = request._carrito_cookie[:-2] + 'xx'
+        self.assertEqual(AlmacenCookie(nuevo_request(cookies={'carrito': alterada})).cargar(), {})
+
+    @override_settings(CART_STORAGE='pedidos.almacenamiento.AlmacenCookie')
+    def test_middleware_escribe_la_cookie(self):
+        respuesta = self.client.post('/limpiar/')
+        self.assertEqual(respuesta.cookies['carrito'].value, '')
+
+
+# --- LOTE DE OPERACIONES DEL CARRITO ---
+
+class LoteCarritoTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        # La versión del menú sube al confirmar (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca, self.plato, self.variante = crear_catalogo()
+
+    def lote(self, *operaciones):
+        return self.client.post(
+            '/carrito/lote/', json.dumps({'operaciones': list(operaciones)}),
+            content_type='application/json',
+        )
+
+    def agregar(self, cantidad=1, **campos):
+        return {'op': 'agregar', 'variante_id': self.variante.id, 'cantidad': cantidad, 'campos': campos}
+
+    def test_aplica_las_operaciones_en_orden(self):
+        key = self.lote(self.agregar(2)).json()['lineas'][0]['item_key']
+        datos = self.lote({'op': 'sumar', 'key': key}, {'op': 'sumar', 'key': key}, {'op': 'restar', 'key': key}).json()
+        self.assertEqual(datos['status'], 'ok')
+        self.assertEqual(datos['lineas'], [
+            {'item_key': key, 'cantidad': 3, 'subtotal': 30.0, 'eliminado': False},
+        ])
+        self.assertEqual((datos['total_items'], datos['total_global']), (3, 30.0))
+
+    def test_una_operacion_invalida_revierte_todo_el_lote(self):
+        key = self.lote(self.agregar()).json()['lineas'][0]['item_key']
+        respuesta = self.lote({'op': 'sumar', 'key': key}, {'op': 'eliminar', 'key': 'no-existe'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['indice'], 1)
+        # La suma de la primera operación no quedó guardada
+        datos = self.lote({'op': 'restar', 'key': key}).json()
+        self.assertEqual(datos['lineas'][0]['eliminado'], True)
+        self.assertEqual(datos['total_items'], 0)
+
+    def test_variante_no_disponible(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variante.activo = False
+            self.variante.save()
+        respuesta = self.lote(self.agregar())
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['message'], 'No disponible')
+
+    def test_tipos_de_json_que_no_corresponden(self):
+        # true es un int para Python: no vale como cantidad ni como variante 1
+        for operacion in (
+            self.agregar(cantidad=True),
+            {'op': 'agregar', 'variante_id': True, 'cantidad': 1},
+            {'op': 'agregar', 'variante_id': self.variante.id, 'campos': ['notas']},
+        ):
+            with self.subTest(operacion=operacion):
+                self.assertEqual(self.lote(operacion).status_code, 400)
+
+    def test_campo_null_queda_vacio(self):
+        self.assertEqual(self.lote(self.agregar(notas=None)).status_code, 200)
+        items = self.client.session[settings.CART_SESSION_ID]['items']
+        self.assertEqual([item['notas'] for item in items.values()], [''])
+
+    def test_lote_mal_formado(self):
+        for cuerpo in ('no es json', json.dumps({'operaciones': 'sumar'}), json.dumps({})):
+            with self.subTest(cuerpo=cuerpo):
+                respuesta = self.client.post('/carrito/lote/', cuerpo, content_type='application/json')
+                self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.lote(*[self.agregar()] * 51).status_code, 400)
+
+
+# --- CARRITO: TOTALES EN CÉNTIMOS ---
+
+@override_settings(CART_STORAGE='pedidos.almacenamiento.AlmacenSesion')
+class CarritoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.request = nuevo_request()
+        self.carrito = Carrito(self.request)
+
+    def assertResumenCuadra(self, carrito):
+        """El resumen acumulado coincide con recorrer las líneas."""
+        lineas = carrito.carrito.values()
+        self.assertEqual(len(carrito), sum(i['cantidad'] for i in lineas))
+        self.assertEqual(
+            carrito.get_total_centimos(), sum(i['precio_centimos'] * i['cantidad'] for i in lineas)
+        )
+
+    def test_totales_exactos(self):
+        # 10 x S/ 0.10 + 3 x S/ 3.33: en flotantes no daría 10.99 exacto
+        for _ in range(10):
+            self.carrito.agregar(1, 1, 10)
+        self.carrito.agregar(2, 3, 333)
+        self.assertEqual(len(self.carrito), 13)
+        self.assertEqual(self.carrito.get_total_centimos(), 1099)
+        self.assertEqual(self.carrito.get_total_precio(), Decimal('10.99'))
+        self.assertEqual(self.carrito.get_cantidad_de_variante(1), 10)
+
+    def test_restar_y_eliminar_ajustan_el_resumen(self):
+        simple = self.carrito.agregar(1, 2, 1250)
+        con_notas = self.carrito.agregar(1, 1, 1250, notas='sin ají')
+        otra = self.carrito.agregar(2, 1, 800)
+        self.carrito.restar(simple)
+        self.carrito.eliminar(otra)
+        self.assertResumenCuadra(self.carrito)
+        self.assertEqual(self.carrito.get_total_centimos(), 2500)
+        self.assertEqual(self.carrito.get_cantidades_por_variante(), {'1': 2})
+
+        self.carrito.restar(con_notas)
+        self.carrito.restar(simple)
+        self.assertEqual((len(self.carrito), self.carrito.get_total_centimos()), (0, 0))
+        self.assertEqual(self.carrito.get_variante_ids(), [])
+
+    def test_precio_nuevo_recalcula_la_linea(self):
+        self.carrito.agregar(1, 2, 1000)
+        self.carrito.agregar(1, 1, 1200)
+        self.assertEqual(self.carrito.get_total_centimos(), 3600)
+        self.assertResumenCuadra(self.carrito)
+
+    def test_lote_revierte_si_falla(self):
+        self.carrito.agregar(1, 1, 1000)
+        with self.assertRaises(ValueError):
+            with self.carrito.lote():
+                self.carrito.agregar(2, 1, 500)
+                self.carrito.agregar(3)  # sin precio: ValueError
+        self.assertEqual(self.carrito.get_total_centimos(), 1000)
+        # La sesión tampoco se queda con el lote a medias
+        self.assertEqual(Carrito(self.request).get_total_centimos(), 1000)
+
+    def test_se_lee_tal_como_se_guardo(self):
+        self.carrito.agregar(1, 2, 1250)
+        guardado = self.request.session[settings.CART_SESSION_ID]
+        self.assertEqual(guardado['formato'], FORMATO_CARRITO)
+        self.assertEqual(Carrito(self.request).resumen, self.carrito.resumen)
+
+    def test_carrito_anterior_se_migra_una_vez(self):
+        # Solo las líneas y con el precio en texto (soles)
+        self.request.session[settings.CART_SESSION_ID] = {
+            '3-x': {'variante_id': 3, 'cantidad': 2, 'precio_unitario': '10.50', 'opciones': [], 'notas': ''},
+        }
+        carrito = Carrito(self.request)
+        self.assertEqual(carrito.get_total_centimos(), 2100)
+        self.assertEqual(carrito.get_cantidades_por_variante(), {'3': 2})
+        guardado = self.request.session[settings.CART_SESSION_ID]
+        self.assertEqual(guardado['formato'], FORMATO_CARRITO)
+        self.assertEqual(guardado['items']['3-x']['precio_centimos'], 1050)
+
+        with mock.patch.object(Carrito, '_normalizar_items') as normalizar:
+            self.assertEqual(len(Carrito(self.request)), 2)
+        normalizar.assert_not_called()
+
+
+# --- CHECKOUT EN BLOQUE ---
+
+class CheckoutTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        # tabla_precios se arma con la versión nueva del menú (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca, self.plato, self.variante = crear_catalogo()
+            grupo = GrupoOpciones.objects.create(nombre='Guarnición')
+            self.arroz = Opcion.objects.create(grupo=grupo, nombre='Arroz', precio_extra=Decimal('2.50'))
+            self.variante.grupos_opciones.add(grupo)
+        self.sede = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.bd = bd_de_sede(self.sede.id)
+
+    def carrito(self, lineas=1):
+        carrito = Carrito(nuevo_request())
+        for numero in range(lineas):
+            carrito.agregar(self.variante.id, 2, 1000, notas=f'mesa {numero}')
+        return carrito
+
+    def pagar(self, carrito, **datos):
+        return checkout.crear_pedido(carrito, self.sede, nombre_contacto='Ana', **datos)
+
+    def test_crea_el_pedido_con_sus_lineas_y_vacia_el_carrito(self):
+        carrito = self.carrito()
+        carrito.agregar(self.variante.id, 1, 1250, opciones_ids=[self.arroz.id], notas='sin ají')
+        pedido = self.pagar(carrito)
+        self.assertEqual(pedido.total, Decimal('32.50'))
+        self.assertEqual(len(carrito), 0)
+        notas = sorted(DetallePedido.objects.using(self.bd).filter(pedido=pedido).values_list('notas', flat=True))
+        self.assertEqual(notas, ['Arroz | sin ají', 'mesa 0'])
+
+    def test_cobra_el_precio_vigente(self):
+        carrito = self.carrito()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variante.precio = Decimal('12.00')
+            self.variante.save()
+        self.assertEqual(self.pagar(carrito).total, Decimal('24.00'))
+
+    def test_carrito_que_no_se_puede_cobrar(self):
+        with self.assertRaisesMessage(PedidoInvalido, 'Tu carrito está vacío.'):
+            self.pagar(Carrito(nuevo_request()))
+
+        carrito = self.carrito()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variante.activo = False
+            self.variante.save()
+        with self.assertRaisesMessage(PedidoInvalido, 'Elimina los ítems agotados'):
+            self.pagar(carrito)
+        self.assertFalse(Pedido.objects.using(self.bd).exists())
+
+    def test_sede_en_pausa(self):
+        self.sede.estado_actual = 'PAUSA'
+        with self.assertRaises(PedidoInvalido):
+            self.pagar(self.carrito())
+
+    def test_la_vista_responde_el_total_en_soles(self):
+        operacion = {
+            'op': 'agregar', 'variante_id': self.variante.id, 'cantidad': 3,
+            'campos': {f'grupo_{self.arroz.grupo_id}': [self.arroz.id]},
+        }
+        self.client.post(
+            '/carrito/lote/', json.dumps({'operaciones': [operacion]}), content_type='application/json',
+        )
+        respuesta = self.client.post(
+            '/checkout/confirmar/',
+            {'sede': self.sede.id, 'nombre_contacto': 'Ana', 'telefono_contacto': '999'},
+            headers={'x-requested-with': 'XMLHttpRequest'},
+        )
+        self.assertEqual(respuesta.json()['total'], 37.5)
+
+    def test_queries_constantes(self):
+        self.pagar(self.carrito())  # cachés del menú ya armadas
+        with CaptureQueriesContext(connections[self.bd]) as pocas:
+            self.pagar(self.carrito(lineas=2))
+        with self.assertNumQueries(len(pocas), using=self.bd):
+            self.pagar(self.carrito(lineas=30))
+
+
+# --- TOTAL DEL PEDIDO CON DELTAS F() ---
+
+class TotalPedidoTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        self.marca, self.plato, self.variante = crear_catalogo()
+        self.sede = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.pedido = crear_pedido(self.sede, self.variante, cantidad=2)  # S/ 20.00
+        self.bd = bd_de_sede(self.sede.id)
+
+    def total(self, pedido=None):
+        return Pedido.objects.using(self.bd).get(pk=(pedido or self.pedido).pk).total
+
+    def nueva_linea(self, pedido=None, cantidad=1, precio='5.50'):
+        return DetallePedido.objects.using(self.bd).create(
+            pedido=pedido or self.pedido, variante=self.variante,
+            cantidad=cantidad, precio_unitario=Decimal(precio),
+        )
+
+    def test_crear_linea_suma_su_subtotal(self):
+        self.assertEqual(self.total(), Decimal('20.00'))
+        self.nueva_linea(cantidad=3)
+        self.assertEqual(self.total(), Decimal('36.50'))
+
+    def test_editar_linea_aplica_solo_la_diferencia(self):
+        linea = DetallePedido.objects.using(self.bd).get(pedido=self.pedido)
+        linea.cantidad = 5
+        linea.save()
+        self.assertEqual(self.total(), Decimal('50.00'))
+        # Un total desfasado a propósito: el delta no lo recalcula desde cero
+        Pedido.objects.using(self.bd).filter(pk=self.pedido.pk).update(total=Decimal('1.00'))
+        linea.cantidad = 4
+        linea.save()
+        self.assertEqual(self.total(), Decimal('-9.00'))
+
+    def test_borrar_linea_resta_su_subtotal(self):
+        linea = self.nueva_linea()
+        linea.delete()
+        self.assertEqual(self.total(), Decimal('20.00'))
+        DetallePedido.objects.using(self.bd).get(pedido=self.pedido).delete()
+        self.assertEqual(self.total(), Decimal('0.00'))
+
+    def test_mover_linea_entre_pedidos(self):
+        otro = crear_pedido(self.sede, self.variante)  # S/ 10.00
+        linea = DetallePedido.objects.using(self.bd).get(pedido=self.pedido)
+        linea.pedido = otro
+        linea.save()
+        self.assertEqual(self.total(), Decimal('0.00'))
+        self.assertEqual(self.total(otro), Decimal('30.00'))
+
+    def test_totales_diferidos_recalculan_al_confirmar(self):
+        # El recálculo se registra en la BD de los pedidos, no en 'default'
+        with self.captureOnCommitCallbacks(using=self.bd, execute=True):
+            with totales_diferidos():
+                for _ in range(3):
+                    self.nueva_linea()
+                # Dentro del bloque no se toca el total
+                self.assertEqual(self.total(), Decimal('20.00'))
+        self.assertEqual(self.total(), Decimal('36.50'))
+
+
+# --- CHECKOUT IDEMPOTENTE ---
+
+class IdempotenciaTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        # tabla_precios se arma con la versión nueva del menú (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.marca, self.plato, self.variante = crear_catalogo()
+        self.sede = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.bd = bd_de_sede(self.sede.id)
+
+    def carrito(self, cantidad=2):
+        carrito = Carrito(nuevo_request())
+        carrito.agregar(self.variante.id, cantidad, 1000)
+        return carrito
+
+    def pagar(self, carrito, clave='clave-1', **datos):
+        return checkout.crear_pedido(carrito, self.sede, clave=clave, nombre_contacto='Ana', **datos)
+
+    def test_reintento_devuelve_el_mismo_pedido(self):
+        carrito = self.carrito()
+        pedido = self.pagar(carrito)
+        self.assertFalse(pedido.repetido)
+        self.assertEqual(pedido.total, Decimal('20.00'))
+        self.assertEqual(len(carrito), 0)
+
+        # El reintento llega con el carrito ya vacío
+        repetido = self.pagar(Carrito(nuevo_request()))
+        self.assertTrue(repetido.repetido)
+        self.assertEqual(repetido.pk, pedido.pk)
+        self.assertEqual(Pedido.objects.using(self.bd).count(), 1)
+        self.assertEqual(DetallePedido.objects.using(self.bd).count(), 1)
+
+    def test_misma_clave_con_otros_datos(self):
+        self.pagar(self.carrito())
+        with self.assertRaises(PedidoInvalido):
+            self.pagar(self.carrito(), telefono_contacto='999')
+
+    def test_claves_distintas_son_pedidos_distintos(self):
+        self.pagar(self.carrito(), clave='clave-1')
+        self.pagar(self.carrito(), clave='clave-2')
+        self.assertEqual(Pedido.objects.using(self.bd).count(), 2)
+
+    def test_peticion_simultanea_que_pierde_la_carrera(self):
+        ganador = self.pagar(self.carrito())
+        # La segunda petición buscó la clave antes de que la primera confirmara:
+        # no la vio y choca en el índice único al reservarla
+        original = checkout._pedido_previo
+        llamadas = []
+
+        def previo(*args):
+            llamadas.append(args)
+            return None if len(llamadas) == 1 else original(*args)
+
+        with mock.patch.object(checkout, '_pedido_previo', side_effect=previo):
+            perdedor = self.pagar(self.carrito())
+        self.assertEqual(len(llamadas), 2)
+        self.assertEqual(perdedor.pk, ganador.pk)
+        self.assertTrue(perdedor.repetido)
+        self.assertEqual(Pedido.objects.using(self.bd).count(), 1)
+        self.assertEqual(ClaveIdempotencia.objects.using(self.bd).count(), 1)
+
+    def envejecer_claves(self):
+        ClaveIdempotencia.objects.using(self.bd).update(
+            creado=timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_VIGENCIA + 1)
+        )
+
+    def test_clave_vencida_no_devuelve_el_pedido_viejo(self):
+        viejo = self.pagar(self.carrito())
+        self.envejecer_claves()
+        # Misma clave con otros datos: ya no choca con la vencida
+        nuevo = self.pagar(self.carrito(), telefono_contacto='999')
+        self.assertFalse(nuevo.repetido)
+        self.assertNotEqual(nuevo.pk, viejo.pk)
+        self.assertEqual(ClaveIdempotencia.objects.using(self.bd).get().pedido_id, nuevo.pk)
+
+    def test_purgar_claves_vencidas(self):
+        self.pagar(self.carrito(), clave='clave-1')
+        self.envejecer_claves()
+        self.pagar(self.carrito(), clave='clave-2')
+        self.assertEqual(checkout.purgar_claves(), 1)
+        self.assertEqual(
+            list(ClaveIdempotencia.objects.using(self.bd).values_list('clave', flat=True)), ['clave-2']
+        )
+
+
+# --- BORRADOS (FK normales o emuladas entre BD) ---
+
+class BorradosTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        self.marca, self.plato, self.variante = crear_catalogo()
+        self.sede = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.pedido = crear_pedido(self.sede, self.variante)
+        self.bd = bd_de_sede(self.sede.id)
+
+    def test_variante_vendida_no_se_borra(self):
+        with self.assertRaises(ProtectedError):
+            self.variante.delete()
+        self.assertTrue(Variante.objects.filter(pk=self.variante.pk).exists())
+
+    def test_plato_con_variante_vendida_no_se_borra(self):
+        # La protección también aplica cuando la variante cae en cascada
+        with self.assertRaises(ProtectedError):
+            self.plato.delete()
+
+    def test_admin_muestra_objetos_protegidos(self):
+        admin = User.objects.create_superuser('admin', 'a@a.pe', 'clave')
+        self.client.force_login(admin)
+        respuesta = self.client.post(
+            f'/admin/catalogo/variante/{self.variante.pk}/delete/', {'post': 'yes'}
+        )
+        # Pantalla de "no se puede borrar", no un 500
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.context['protected'])
+        self.assertTrue(Variante.objects.filter(pk=self.variante.pk).exists())
+
+    def test_borrar_sede_borra_sus_pedidos(self):
+        otra = Sede.objects.create(nombre='Surco', direccion='-', telefono='-')
+        ajeno = crear_pedido(otra, self.variante)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sede.delete()
+        self.assertFalse(Pedido.objects.using(self.bd).filter(pk=self.pedido.pk, sede_id=self.sede.id).exists())
+        self.assertFalse(DetallePedido.objects.using(self.bd).filter(pedido_id=self.pedido.pk).exists())
+        self.assertTrue(Pedido.objects.using(bd_de_sede(otra.id)).filter(pk=ajeno.pk).exists())
+
+    def test_borrar_mesa_suelta_el_pedido(self):
+        mesa = Mesa.objects.create(sede=self.sede, numero='4')
+        Pedido.objects.using(self.bd).filter(pk=self.pedido.pk).update(mesa=mesa)
+        with self.captureOnCommitCallbacks(execute=True):
+            mesa.delete()
+        self.pedido.refresh_from_db(using=self.bd)
+        self.assertIsNone(self.pedido.mesa_id)
+
+
+# --- SEDE POR DEFECTO DEL VISITANTE ---
+
+class SedePorDefectoTests(TestCase):
+    databases = BASES
+
+    def setUp(self):
+        self.miraflores = Sede.objects.create(nombre='Miraflores', direccion='-', telefono='-')
+        self.surco = Sede.objects.create(nombre='Surco', direccion='-', telefono='-')
+
+    def test_se_consulta_una_vez(self):
+        self.assertEqual(sede_visitante(nuevo_request()), self.miraflores.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(sede_visitante(nuevo_request()), self.miraflores.id)
+        # La que eligió el visitante manda
+        self.assertEqual(sede_visitante(nuevo_request(session={SESION_SEDE: self.surco.id})), self.surco.id)
+
+    def test_el_semaforo_cambia_la_sede_por_defecto(self):
+        self.assertEqual(sede_por_defecto(), self.miraflores.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.miraflores.estado_actual = 'PAUSA'
+            self.miraflores.save()
+        self.assertEqual(sede_por_defecto(), self.surco.id)
+
+
+# --- PEDIDOS ACTIVOS (ÍNDICE PARCIAL) ---
+
+class FueraDeLiteralesTests(SimpleTestCase):
+
+    def test_repite_los_literales_del_indice(self):
+        sql = str(Pedido.objects.activos().query)
+        self.assertIn("NOT (\"pedidos_pedido\".\"estado\" IN ('ENTREGADO', 'CANCELADO'))", sql)
+
+    def test_solo_identificadores_simples(self):
+        for valor in ("A'B", '50%', 'DOS PALABRAS', 3):
+            with self.subTest(valor=valor):
+                with self.assertRaises(ValueError):
+                    str(Pedido.objects.filter(FueraDeLiterales(F('estado'), (valor,))).query)
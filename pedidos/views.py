@@ -1,14 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from django.db import models 
-from .carrito import Carrito # Importación LOCAL del archivo carrito.py
-from catalogo.models import Variante, Categoria, Opcion 
-from core.models import Marca 
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from .carrito import Carrito, SESION_SEDE, sede_visitante # Importación LOCAL del archivo carrito.py
+from catalogo.models import Variante 
+from catalogo.seleccion import SeleccionInvalida
+from catalogo.menu_cache import (
+    html_menu, json_menu, etag_menu, actualizado_menu, html_modal, html_modales_categoria,
+    tabla_precios, mascara_sede, disponible_en,
+)
+from core.models import Marca, Sede
+from .models import Pedido
+from .checkout import crear_pedido, PedidoInvalido, ESTADOS_SIN_PEDIDOS
+from .cocina import flujo_sede
 from django.contrib.admin.views.decorators import staff_member_required
-from decimal import Decimal 
+from core.dinero import a_centimos, a_json
 from django.template.loader import render_to_string 
 import json 
-from django.views.decorators.http import require_POST
+import re
+import uuid
+from django.views.decorators.http import require_POST, require_GET
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.datastructures import MultiValueDict
+from django.utils.http import url_has_allowed_host_and_scheme
 
 # --- FUNCIONES AUXILIARES ---
 
@@ -16,31 +29,125 @@ def check_hay_agotados(carrito):
     """Revisa si queda algún item agotado en el carrito."""
     
     ids = carrito.get_variante_ids()
-    
-    agotados_variantes = Variante.objects.filter(id__in=ids).filter(
-        models.Q(activo=False) | 
-        models.Q(plato__activo_manual=False) | 
-        models.Q(plato__insumos_clave__disponible=False) 
-    ).distinct().values_list('id', flat=True)
+    if not ids:
+        return False
 
-    agotados_ids = set(agotados_variantes)
-    
-    for item in carrito.carrito.values():
-        if item.get('variante_id') in agotados_ids:
-            return True
-    return False
+    # Un bit por variante en el bitset de la sede del visitante (sin queries)
+    mascara = carrito.disponibles()
+    return not all(disponible_en(mascara, variante_id) for variante_id in ids)
 
 def generar_carrito_data_js(carrito):
     """
     Genera el diccionario {variante_id: cantidad} para que JavaScript lo lea.
     """
-    carrito_data = {}
-    for item in carrito.carrito.values():
-        variante_id = item['variante_id']
-        cantidad = item['cantidad']
-        carrito_data[str(variante_id)] = carrito_data.get(str(variante_id), 0) + cantidad
-    # Retornamos el objeto serializado a JSON string
-    return json.dumps(carrito_data)
+    # Sale del resumen acumulado del carrito (sin recorrer las líneas)
+    return json.dumps(carrito.get_cantidades_por_variante())
+
+
+def preparar_seleccion(ficha, datos):
+    """
+    Valida las opciones enviadas para una variante y calcula su precio.
+    'ficha' es la entrada de la variante en tabla_precios() (sin queries) y
+    'datos' es request.POST (o un MultiValueDict equivalente).
+    Devuelve (precio_final en céntimos, opciones_ids, notas) o lanza SeleccionInvalida.
+    """
+    # Pertenencia, cardinalidad y obligatorios en una pasada (catalogo/seleccion.py)
+    opciones_ids, extra = ficha['validador'].validar(datos)
+    notas = datos.get('notas', '').strip()[:200]
+
+    # Cálculo de Precio (Lado del Servidor), en céntimos
+    return ficha['precio_centimos'] + extra, opciones_ids, notas
+
+
+def ficha_variante(variante_id):
+    """Ficha de precios de la variante (404 si no existe). No dice si está disponible."""
+    ficha = tabla_precios().get(variante_id)
+    if ficha is None:
+        raise Http404('Variante no encontrada.')
+    return ficha
+
+
+def _delta_linea(carrito, item_key):
+    """Estado final de una línea del carrito (cantidad y subtotal, o eliminada)."""
+    item = carrito.carrito.get(item_key)
+    eliminado = item is None
+    return {
+        'item_key': item_key,
+        'cantidad': 0 if eliminado else item['cantidad'],
+        'subtotal': 0 if eliminado else a_json(item['precio_centimos'] * item['cantidad']),
+        'eliminado': eliminado,
+    }
+
+
+def _pide_ticket_completo(request):
+    return request.POST.get('ticket', request.GET.get('ticket')) == 'completo'
+
+
+def respuesta_delta(request, carrito, item_key, variante_id, linea_nueva=False, **extra):
+    """
+    Respuesta de una mutación del carrito: solo la línea que cambió, los totales
+    y el badge de la variante. El ticket completo se renderiza únicamente si el
+    cliente lo pide (ticket=completo) o si el carrito quedó vacío (render trivial).
+    """
+    total_items = carrito.get_total_items()
+
+    data = {
+        'status': 'ok',
+        **_delta_linea(carrito, item_key),
+        'total_global': a_json(carrito.get_total_centimos()),
+        'total_items': total_items,
+        'cant_total': total_items,
+        'variante_id': variante_id,
+        'cant_producto': carrito.get_cantidad_de_variante(variante_id) if variante_id else 0,
+    }
+    data.update(extra)
+
+    if _pide_ticket_completo(request) or total_items == 0:
+        data['html_ticket'] = render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request)
+    elif linea_nueva and not data['eliminado']:
+        # Línea que no existía en el ticket: se renderiza solo esa
+        item_detalle = next(carrito.iterar_detalles(keys=[item_key]), None)
+        if item_detalle:
+            data['html_linea'] = render_to_string('pedidos/linea_ticket.html', {'item': item_detalle}, request=request)
+
+    return JsonResponse(data)
+
+
+# --- SEDE DEL VISITANTE ---
+
+def _contexto_sedes(carrito):
+    """Sedes para el selector y la que hoy usa el visitante (carta, carrito y checkout)."""
+    return {
+        'sedes': Sede.objects.exclude(estado_actual__in=ESTADOS_SIN_PEDIDOS),
+        'sede_visitante': carrito.sede_id,
+    }
+
+
+@require_POST
+def elegir_sede(request):
+    """Guarda la sede del visitante: la carta y el carrito pasan a mostrar su disponibilidad."""
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    try:
+        sede_id = int(request.POST.get('sede', ''))
+    except ValueError:
+        sede_id = None
+    if sede_id is None or not Sede.objects.filter(id=sede_id).exists():
+        if es_ajax:
+            return JsonResponse({'status': 'error', 'message': 'Sede no válida.'}, status=400)
+        return redirect('menu')
+
+    request.session[SESION_SEDE] = sede_id
+    if es_ajax:
+        return JsonResponse({
+            'status': 'ok',
+            'sede_id': sede_id,
+            'hay_agotados': check_hay_agotados(Carrito(request)),
+        })
+
+    destino = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+        destino = 'menu'
+    return redirect(destino)
 
 
 # --- VISTAS DEL CATÁLOGO (Carga Inicial y Retorno del Carrito) ---
@@ -49,23 +156,22 @@ def catalogo_general(request):
     """Carga la primera marca al entrar a la web."""
     marca_actual = Marca.objects.filter(activo=True).order_by('id').first()
     lista_marcas = list(Marca.objects.filter(activo=True).order_by('id')) 
-    categorias = []
     carrito = Carrito(request) 
     
     if marca_actual:
-        categorias = Categoria.objects.filter(
-            marca=marca_actual,
-            activo=True
-        ).prefetch_related('platos', 'platos__variantes').order_by('orden')
+        platos_html = html_menu(marca_actual, carrito.sede_id)
+    else:
+        platos_html = render_to_string('catalogo/platos_list.html', {'categorias': []})
         
     context = {
         'marca_actual': marca_actual,
         'todas_marcas': lista_marcas,
-        'categorias': categorias,
+        'platos_html': platos_html,
         'cart_count': carrito.get_total_items(),
         'carrito': carrito,
         # CLAVE: Inyectamos el JSON string de las cantidades para persistencia en JS
         'carrito_data_json': generar_carrito_data_js(carrito), 
+        **_contexto_sedes(carrito),
     }
     return render(request, 'catalogo/menu.html', context)
 
@@ -74,19 +180,15 @@ def catalogo_por_marca(request, marca_slug):
     marca_actual = get_object_or_404(Marca, slug=marca_slug)
     lista_marcas = list(Marca.objects.filter(activo=True).order_by('id')) 
     
-    categorias = Categoria.objects.filter(
-        marca=marca_actual,
-        activo=True
-    ).prefetch_related('platos', 'platos__variantes').order_by('orden')
-
     carrito = Carrito(request) 
     context = {
         'marca_actual': marca_actual,
         'todas_marcas': lista_marcas, 
-        'categorias': categorias,
+        'platos_html': html_menu(marca_actual, carrito.sede_id),
         'cart_count': carrito.get_total_items(),
         'carrito': carrito,
         'carrito_data_json': generar_carrito_data_js(carrito),
+        **_contexto_sedes(carrito),
     }
     return render(request, 'catalogo/menu.html', context)
 
@@ -97,16 +199,8 @@ def ajax_platos_by_marca(request, marca_slug):
     marca_actual = get_object_or_404(Marca, slug=marca_slug)
     carrito = Carrito(request) 
 
-    categorias = Categoria.objects.filter(
-        marca=marca_actual,
-        activo=True
-    ).prefetch_related('platos', 'platos__variantes').order_by('orden')
-
-    context = {
-        'categorias': categorias, 
-        'carrito': carrito, 
-    }
-    platos_html = render_to_string('catalogo/platos_list.html', context, request=request)
+    # HTML compartido por versión del menú y sede; los badges los pinta JS con carrito_data
+    platos_html = html_menu(marca_actual, carrito.sede_id)
     
     # Preparamos los datos del carrito para JavaScript
     carrito_data_str = generar_carrito_data_js(carrito)
@@ -118,20 +212,43 @@ def ajax_platos_by_marca(request, marca_slug):
     })
 
 
+@require_GET
+def api_menu_marca(request, marca_slug):
+    """
+    Carta de la marca en JSON con ETag (versión del menú y de la sede del
+    visitante) y Last-Modified. Si el navegador ya tiene la versión vigente,
+    responde 304 sin cuerpo.
+    El carrito NO viaja aquí: el front lo mantiene en memoria.
+    """
+    marca_actual = get_object_or_404(Marca, slug=marca_slug)
+    sede_id = sede_visitante(request)
+    etag = etag_menu(marca_actual, sede_id)
+    ultima_modificacion = actualizado_menu()
+
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = HttpResponse(json_menu(marca_actual, sede_id), content_type='application/json')
+
+    # La sede sale de la sesión: un caché intermedio no debe mezclar visitantes
+    patch_vary_headers(response, ['Cookie'])
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(ultima_modificacion)
+    # El cliente puede guardar la respuesta, pero debe revalidarla siempre
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 # --- VISTAS DE CARRITO Y MODAL ---
 
 def modal_opciones(request, variante_id):
-    """Vista para cargar el modal con opciones y precio base."""
-    variante = get_object_or_404(Variante.objects.prefetch_related('inclusiones', 'grupos_opciones__opciones'), id=variante_id)
-    
-    #grupos = variante.grupos_opciones.filter(activo=True).prefetch_related('opciones')
+    """Vista para cargar el modal con opciones y precio base (cacheado por versión del menú)."""
+    return HttpResponse(html_modal(variante_id))
 
-    context = {
-        'variante': variante,
-        'grupos': variante.grupos_opciones.filter(activo=True),
-        'inclusiones': variante.inclusiones.filter(activo=True),
-    }
-    return render(request, 'catalogo/modal_opciones.html', context)
+
+@require_GET
+def modales_categoria(request, categoria_id):
+    """Todos los modales de una categoría en un solo viaje, para precargarlos en el front."""
+    return JsonResponse({'modales': html_modales_categoria(categoria_id)})
 
 
 def agregar_carrito(request, variante_id):
@@ -147,71 +264,37 @@ def agregar_carrito(request, variante_id):
         return JsonResponse({'status': 'error', 'message': 'La cantidad debe ser mayor a 0.'})
 
     carrito = Carrito(request)
-    variante = get_object_or_404(Variante, id=variante_id)
+    # Precio y opciones salen de la tabla en memoria; la disponibilidad, del
+    # bitset de la sede del visitante (0 queries al catálogo)
+    ficha = ficha_variante(variante_id)
 
-    if not variante.esta_disponible:
+    if not disponible_en(carrito.disponibles(), variante_id):
         # En lugar de preguntar si es XMLHttpRequest, devolvemos error siempre
         # porque esta vista es para una acción de botón
         return JsonResponse({'status': 'error', 'message': 'No disponible'}, status=400)
 
     if request.method == 'POST':
-        # --- VALIDACIÓN DE OBLIGATORIOS ---
-        grupos_obligatorios = variante.grupos_opciones.filter(obligatorio=True, activo=True)
-        for grupo in grupos_obligatorios:
-            field_name = f'grupo_{grupo.id}'
-            if not request.POST.get(field_name):
-                # CAMBIO: Siempre devolver JSON si falta algo
-                return JsonResponse({
-                    'status': 'error', 
-                    'message': f'Debes seleccionar: {grupo.nombre}'
-                }, status=400)
-
-        # 3. Recopilar y Validar Opciones
-        opciones_ids = []
-        for key in request.POST:
-            if key.startswith('grupo_'):
-                valores = request.POST.getlist(key)
-                for val in valores:
-                    if val.isdigit(): # Validación rápida antes de convertir
-                        opciones_ids.append(int(val))
-        
-        notas = request.POST.get('notas', '').strip()[:200]
-        
-        # 4. Cálculo de Precio (Lado del Servidor)
-        precio_final = variante.precio 
-        
-        if opciones_ids:
-            opciones_validas = Opcion.objects.filter(
-                id__in=opciones_ids,
-                grupo__variante=variante,
-                activo=True
-            )
-            
-            # Verificación de integridad de IDs
-            if opciones_validas.count() != len(set(opciones_ids)):
-                return JsonResponse({'status': 'error', 'message': 'Selección de opciones no válida.'})
+        try:
+            precio_final, opciones_ids, notas = preparar_seleccion(ficha, request.POST)
+        except SeleccionInvalida as error:
+            # CAMBIO: Siempre devolver JSON si falta algo
+            return JsonResponse({'status': 'error', 'message': str(error)}, status=400)
 
-            extra = opciones_validas.aggregate(total=models.Sum('precio_extra'))['total'] or 0
-            precio_final += extra
-        
         # 5. AGREGAR AL CARRITO (¡Aquí se usa la cantidad!)
-        carrito.agregar(
-            variante_id=variante.id, 
+        item_key = carrito.agregar(
+            variante_id=variante_id, 
             cantidad=cantidad,           # <--- FALTABA ESTO
-            precio_unitario=precio_final, 
+            precio_centimos=precio_final, 
             opciones_ids=opciones_ids, 
             notas=notas
         )
 
-    # 6. Respuesta AJAX
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({
-            'status': 'ok',
-            'cant_total': carrito.get_total_items(),
-            'html_ticket': render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request),
-            'cant_producto': carrito.get_cantidad_de_variante(variante.id),
-            'variante_id': variante.id
-        })
+    # 6. Respuesta AJAX (delta: solo la línea agregada y los totales)
+    if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        cantidad_linea = carrito.carrito[item_key]['cantidad']
+        return respuesta_delta(
+            request, carrito, item_key, variante_id, linea_nueva=(cantidad_linea == cantidad)
+        )
 
     return redirect('menu')
 
@@ -234,41 +317,20 @@ def sumar_plato(request, item_key):
         return JsonResponse({'status': 'error', 'message': 'Item no encontrado en carrito.'})
     
     variante_id = item_data['variante_id']
-    variante = get_object_or_404(Variante, id=variante_id)
-
-    if not variante.esta_disponible:
+    ficha_variante(variante_id)  # 404 si la variante ya no existe
+    if not disponible_en(carrito.disponibles(), variante_id):
         return JsonResponse({'status': 'error', 'message': 'No disponible'})
 
     carrito.agregar(
         variante_id=variante_id, 
         cantidad=1, 
-        precio_unitario=Decimal(item_data['precio_unitario']),
+        precio_centimos=item_data['precio_centimos'],
         opciones_ids=item_data['opciones'], 
         notas=item_data['notas']
     )
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        item = carrito.carrito.get(item_key)
-        cantidad = item['cantidad']
-        precio_unitario = Decimal(item['precio_unitario'])
-        subtotal = precio_unitario * cantidad
-
-        # --- AGREGADO SOLO LO NECESARIO ---
-        html_ticket = render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request)
-        # Obtenemos la cantidad total de esta variante específica para el "badge negrito"
-        cant_producto = carrito.get_cantidad_de_variante(variante_id)
-        # ----------------------------------
-        return JsonResponse({
-            'status': 'ok',
-            'cantidad': cantidad,
-            'subtotal': float(subtotal), 
-            'total_global': float(carrito.get_total_precio()),
-            'total_items': carrito.get_total_items(),
-            'eliminado': False,
-            'html_ticket': html_ticket, 
-            'variante_id': variante_id,
-            'cant_producto': cant_producto
-        })
+        return respuesta_delta(request, carrito, item_key, variante_id)
     return redirect('ver_carrito')
 
 @require_POST
@@ -279,37 +341,12 @@ def restar_plato(request, item_key):
     carrito.restar(item_key) 
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        item = carrito.carrito.get(item_key)
-        eliminado = item is None
-        
-        if eliminado:
-            cantidad = 0
-            subtotal = 0
-            hay_agotados_despues = check_hay_agotados(carrito)
-        else:
-            cantidad = item['cantidad']
-            precio_unitario = Decimal(item['precio_unitario'])
-            subtotal = precio_unitario * cantidad
-            hay_agotados_despues = False
-        
-        html_ticket = render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request)
-        # Calculamos cuánto queda del producto para el "badge negrito"
-        cant_producto = 0
-        if variante_id_antes:
-             cant_producto = carrito.get_cantidad_de_variante(variante_id_antes)
-        # ----------------------------------
-        return JsonResponse({
-            'status': 'ok',
-            'cantidad': cantidad,
-            'subtotal': float(subtotal),
-            'total_global': float(carrito.get_total_precio()),
-            'total_items': carrito.get_total_items(),
-            'eliminado': eliminado,
-            'hay_agotados': hay_agotados_despues,
-            'html_ticket': html_ticket,
-            'variante_id': variante_id_antes,
-            'cant_producto': cant_producto
-        })
+        # Solo si la línea desapareció puede haberse liberado el bloqueo por agotados
+        eliminado = item_key not in carrito.carrito
+        hay_agotados_despues = check_hay_agotados(carrito) if eliminado else False
+        return respuesta_delta(
+            request, carrito, item_key, variante_id_antes, hay_agotados=hay_agotados_despues
+        )
     return redirect('ver_carrito')
 
 @require_POST
@@ -320,31 +357,155 @@ def eliminar_carrito(request, item_key):
     carrito.eliminar(item_key) 
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        sigue_bloqueado = check_hay_agotados(carrito)
-        html_ticket = render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request)
-        
-        # OBTENEMOS EL DICCIONARIO ACTUALIZADO DE CANTIDADES {variante_id: cantidad}
-        # Usamos tu función auxiliar que ya existe
-        carrito_data_str = generar_carrito_data_js(carrito) 
-        cant_producto_restante = 0
-        if variante_id:
-            cant_producto_restante = carrito.get_cantidad_de_variante(variante_id)
+        # Enviamos el diccionario real {variante_id: cantidad} para que JS refresque todos los badges
+        return respuesta_delta(
+            request, carrito, item_key, variante_id,
+            hay_agotados=check_hay_agotados(carrito),
+            carrito_data=json.loads(generar_carrito_data_js(carrito)),
+        )
+    return redirect('ver_carrito')
+
+
+# --- LOTE DE OPERACIONES DEL CARRITO ---
+
+MAX_OPERACIONES_LOTE = 50
+
+
+class OperacionInvalida(Exception):
+    pass
+
+
+def _aplicar_operacion(carrito, op, fichas, mascara):
+    """Aplica una operación del lote. Lanza OperacionInvalida si no se puede."""
+    tipo = op.get('op')
+
+    if tipo in ('sumar', 'restar', 'eliminar'):
+        item_key = str(op.get('key', ''))
+        item = carrito.carrito.get(item_key)
+        if item is None:
+            raise OperacionInvalida('Item no encontrado en carrito.')
+
+        if tipo == 'sumar':
+            ficha = fichas.get(item['variante_id'])
+            if ficha is None or not disponible_en(mascara, item['variante_id']):
+                raise OperacionInvalida('No disponible')
+            carrito.agregar(
+                variante_id=item['variante_id'],
+                cantidad=1,
+                precio_centimos=item['precio_centimos'],
+                opciones_ids=item['opciones'],
+                notas=item['notas']
+            )
+        elif tipo == 'restar':
+            carrito.restar(item_key)
+        else:
+            carrito.eliminar(item_key)
+        return item_key
+
+    if tipo == 'agregar':
+        variante_id = op.get('variante_id')
+        # bool es subclase de int: true no puede colarse como la variante 1
+        es_entero = isinstance(variante_id, int) and not isinstance(variante_id, bool)
+        ficha = fichas.get(variante_id) if es_entero else None
+        if ficha is None or not disponible_en(mascara, variante_id):
+            raise OperacionInvalida('No disponible')
+        cantidad = op.get('cantidad', 1)
+        if not isinstance(cantidad, int) or isinstance(cantidad, bool) or not 0 < cantidad <= 10:
+            raise OperacionInvalida('Cantidad no válida (1 a 10).')
+
+        # Los campos llegan como en el formulario del modal: {"grupo_3": ["7"], "notas": "..."}
+        campos = MultiValueDict()
+        recibidos = op.get('campos') or {}
+        if not isinstance(recibidos, dict):
+            raise OperacionInvalida('Campos no válidos.')
+        for nombre, valor in recibidos.items():
+            valores = valor if isinstance(valor, list) else [valor]
+            # Un null de JSON es "sin valor", no el texto 'None'
+            campos.setlist(nombre, [str(v) for v in valores if v is not None])
+        try:
+            precio_final, opciones_ids, notas = preparar_seleccion(ficha, campos)
+        except SeleccionInvalida as error:
+            raise OperacionInvalida(str(error))
+
+        return carrito.agregar(
+            variante_id=variante_id,
+            cantidad=cantidad,
+            precio_centimos=precio_final,
+            opciones_ids=opciones_ids,
+            notas=notas
+        )
+
+    raise OperacionInvalida(f'Operación desconocida: {tipo}')
+
+
+@require_POST
+def carrito_lote(request):
+    """
+    Aplica una lista ordenada de operaciones al carrito con UNA sola escritura.
+    Cuerpo JSON: {"operaciones": [{"op": "sumar", "key": "..."}, ...], "ticket": "completo"?}
+    Es todo o nada: si una operación falla, el carrito queda como estaba.
+    """
+    try:
+        cuerpo = json.loads(request.body or b'{}')
+        operaciones = cuerpo['operaciones']
+        if not isinstance(operaciones, list) or not all(isinstance(op, dict) for op in operaciones):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Lote mal formado.'}, status=400)
+
+    if len(operaciones) > MAX_OPERACIONES_LOTE:
+        return JsonResponse({'status': 'error', 'message': 'Demasiadas operaciones.'}, status=400)
+
+    carrito = Carrito(request)
+    # Precios y disponibilidad de la sede en memoria: el lote no consulta el catálogo
+    fichas = tabla_precios()
+    mascara = carrito.disponibles()
 
+    claves_antes = set(carrito.carrito)
+    tocadas = []
+    try:
+        with carrito.lote():
+            for indice, op in enumerate(operaciones):
+                try:
+                    item_key = _aplicar_operacion(carrito, op, fichas, mascara)
+                except OperacionInvalida as error:
+                    error.indice = indice
+                    raise
+                if item_key not in tocadas:
+                    tocadas.append(item_key)
+    except OperacionInvalida as error:
         return JsonResponse({
-            'status': 'ok',
-            'cant_total': carrito.get_total_items(),
-            'total_global': float(carrito.get_total_precio()),
-            'html_ticket': html_ticket,
-            'total_items': carrito.get_total_items(),
-            'eliminado': True,
-            'variante_id': variante_id,
-            'hay_agotados': sigue_bloqueado,
-            # Enviamos el diccionario real para que JS refresque todos los badges
-            'carrito_data': json.loads(carrito_data_str),
-            'cant_producto': cant_producto_restante
+            'status': 'error',
+            'message': str(error),
+            'indice': error.indice,
+        }, status=400)
 
-        })
-    return redirect('ver_carrito')
+    total_items = carrito.get_total_items()
+    data = {
+        'status': 'ok',
+        'lineas': [_delta_linea(carrito, key) for key in tocadas],
+        'total_global': a_json(carrito.get_total_centimos()),
+        'total_items': total_items,
+        'cant_total': total_items,
+        'hay_agotados': check_hay_agotados(carrito),
+        'carrito_data': json.loads(generar_carrito_data_js(carrito)),
+    }
+
+    if cuerpo.get('ticket') == 'completo' or total_items == 0:
+        data['html_ticket'] = render_to_string('pedidos/carrito_sidebar.html', {'carrito': carrito}, request=request)
+    else:
+        # Solo las líneas que no existían antes del lote se renderizan
+        nuevas = [key for key in tocadas if key not in claves_antes and key in carrito.carrito]
+        if nuevas:
+            html_lineas = {
+                item['key']: render_to_string('pedidos/linea_ticket.html', {'item': item}, request=request)
+                for item in carrito.iterar_detalles(keys=nuevas)
+            }
+            for linea in data['lineas']:
+                if linea['item_key'] in html_lineas:
+                    linea['html_linea'] = html_lineas[linea['item_key']]
+
+    return JsonResponse(data)
 
 
 @require_POST
@@ -367,5 +528,118 @@ def toggle_variante_status(request, variante_id):
     return redirect(request.META.get('HTTP_REFERER', 'admin:index'))
 
 
+METODOS_PAGO = ('EFECTIVO', 'YAPE', 'PLIN', 'TARJETA')
+
+
+def _contexto_checkout(carrito, **extra):
+    return {
+        'carrito': carrito,
+        'hay_agotados': check_hay_agotados(carrito),
+        **_contexto_sedes(carrito),
+        'tipos_servicio': Pedido.TIPOS,
+        'metodos_pago': METODOS_PAGO,
+        # Nueva en cada render: un reenvío del MISMO formulario reusa la suya
+        'clave_idempotencia': uuid.uuid4().hex,
+        **extra,
+    }
+
+
 def iniciar_pago(request):
-    return render(request, 'pedidos/checkout.html', {})
\ No newline at end of file
+    """Formulario de datos de entrega y pago."""
+    carrito = Carrito(request)
+    if not carrito.carrito:
+        return redirect('ver_carrito')
+    return render(request, 'pedidos/checkout.html', _contexto_checkout(carrito))
+
+
+def _datos_pedido(post):
+    """Valida el formulario de checkout. Devuelve (sede_id, datos) o lanza PedidoInvalido."""
+    try:
+        sede_id = int(post.get('sede', ''))
+    except ValueError:
+        raise PedidoInvalido('Elige la sede que atenderá tu pedido.')
+
+    nombre = post.get('nombre_contacto', '').strip()[:100]
+    telefono = post.get('telefono_contacto', '').strip()[:20]
+    tipo = post.get('tipo_servicio', 'RECOJO')
+    direccion = post.get('direccion_entrega', '').strip()[:200]
+    metodo = post.get('metodo_pago', 'EFECTIVO')
+
+    if not nombre or not telefono:
+        raise PedidoInvalido('Necesitamos tu nombre y teléfono.')
+    if tipo not in dict(Pedido.TIPOS):
+        raise PedidoInvalido('Tipo de servicio no válido.')
+    if tipo == 'DELIVERY' and not direccion:
+        raise PedidoInvalido('Indica la dirección de entrega.')
+    if metodo not in METODOS_PAGO:
+        raise PedidoInvalido('Método de pago no válido.')
+
+    return sede_id, {
+        'nombre_contacto': nombre,
+        'telefono_contacto': telefono,
+        'tipo_servicio': tipo,
+        'direccion_entrega': direccion,
+        'metodo_pago': metodo,
+    }
+
+
+CLAVE_IDEMPOTENCIA_VALIDA = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def _clave_idempotencia(request):
+    """Header Idempotency-Key (clientes JS) o campo oculto del formulario. Opcional."""
+    clave = request.headers.get('Idempotency-Key') or request.POST.get('clave_idempotencia', '')
+    if not clave:
+        return None
+    if not CLAVE_IDEMPOTENCIA_VALIDA.match(clave):
+        raise PedidoInvalido('Solicitud no válida. Recarga la página.')
+    return clave
+
+
+@require_POST
+def confirmar_pedido(request):
+    """Crea el Pedido desde el carrito (ver pedidos/checkout.py)."""
+    carrito = Carrito(request)
+    try:
+        clave = _clave_idempotencia(request)
+        sede_id, datos = _datos_pedido(request.POST)
+        sede = Sede.objects.filter(id=sede_id).first()
+        if sede is None:
+            raise PedidoInvalido('Elige la sede que atenderá tu pedido.')
+        # La sede del formulario pasa a ser la del visitante: si algo está agotado
+        # ahí, el carrito lo marcará al volver
+        request.session[SESION_SEDE] = carrito.sede_id = sede.id
+        pedido = crear_pedido(carrito, sede, clave=clave, **datos)
+    except PedidoInvalido as error:
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'error', 'message': str(error)}, status=400)
+        contexto = _contexto_checkout(carrito, error=str(error), datos=request.POST)
+        return render(request, 'pedidos/checkout.html', contexto, status=400)
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            'status': 'ok',
+            'pedido_id': pedido.id,
+            'total': a_json(a_centimos(pedido.total)),
+            'repetido': pedido.repetido,
+        })
+    return render(request, 'pedidos/checkout.html', {'pedido': pedido})
+
+# --- PANTALLA DE COCINA (KDS) ---
+
+@staff_member_required
+def cocina(request, sede_id):
+    """Pantalla de cocina de una sede; se alimenta de cocina_stream."""
+    sede = get_object_or_404(Sede, id=sede_id)
+    return render(request, 'pedidos/cocina.html', {'sede': sede, 'sedes': Sede.objects.all()})
+
+
+@staff_member_required
+async def cocina_stream(request, sede_id):
+    """Pedidos nuevos y cambios de estado de una sede, por SSE (ver pedidos/cocina.py)."""
+    if not await Sede.objects.filter(id=sede_id).aexists():
+        raise Http404('Sede no encontrada')
+    respuesta = StreamingHttpResponse(flujo_sede(sede_id), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'  # nginx: no acumular el stream
+    return respuesta